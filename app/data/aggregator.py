@@ -1,65 +1,141 @@
-from datetime import datetime, timedelta
-from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+import heapq
 import pytz
 
+DEFAULT_INTERVALS = (
+    timedelta(minutes=1),
+    timedelta(minutes=5),
+    timedelta(minutes=15),
+    timedelta(hours=1),
+)
+
+def _seconds(interval):
+    if isinstance(interval, timedelta):
+        return interval.total_seconds()
+    return interval
+
+class Candle:
+    """One live bar. Bucket start is kept as epoch seconds to stay small."""
+
+    __slots__ = ("start", "open", "high", "low", "close", "volume", "trade_count", "notional")
+
+    def __init__(self, start, price, volume):
+        self.start = start
+        self.open = price
+        self.high = price
+        self.low = price
+        self.close = price
+        self.volume = volume
+        self.trade_count = 1
+        self.notional = price * volume
+
+    def add(self, price, volume):
+        if price > self.high:
+            self.high = price
+        if price < self.low:
+            self.low = price
+        self.close = price
+        self.volume += volume
+        self.trade_count += 1
+        self.notional += price * volume
+
+    @property
+    def vwap(self):
+        return self.notional / self.volume if self.volume else self.close
+
+    def to_bar(self, symbol, interval):
+        return {
+            "symbol": symbol,
+            "interval": interval,
+            "datetime": datetime.fromtimestamp(self.start, tz=timezone.utc),
+            "open": self.open,
+            "high": self.high,
+            "low": self.low,
+            "close": self.close,
+            "volume": self.volume,
+            "trade_count": self.trade_count,
+            "vwap": self.vwap,
+        }
+
 class CandleAggregator:
-    def __init__(self, interval=timedelta(minutes=1)):
-        self.interval = interval
-        self.current_candles = {}  # symbol → (start_time, bar)
+    """
+    Rolls a single trade stream into candles for several intervals at once.
+
+    Bars are closed by event time. The watermark is the newest trade timestamp
+    seen minus `lateness`; a candle is emitted once its bucket end falls
+    behind the watermark. Open candles sit in a min-heap keyed by bucket end,
+    so a flush only touches the candles that are actually due.
+
+    The wall clock passed to pop_ready_bars only moves the watermark to
+    `now - idle_lateness`, to close bars once the whole stream has gone
+    quiet. It is kept far behind so that handlers running behind the socket
+    in a burst do not see their queued trades turn late.
+
+    A trade whose bucket has already closed in any interval is counted once
+    in `late_trades` and dropped from every interval, so the intervals never
+    disagree about which trades they hold.
+    """
+
+    def __init__(self, intervals=DEFAULT_INTERVALS, lateness=timedelta(seconds=2), idle_lateness=timedelta(seconds=60)):
+        if isinstance(intervals, (int, float, timedelta)):
+            intervals = (intervals,)
+        self.intervals = tuple(int(_seconds(interval)) for interval in intervals)
+        self.lateness = _seconds(lateness)
+        self.idle_lateness = _seconds(idle_lateness)
+        self.current_candles = {}  # (symbol, interval, start) → Candle
+        self.deadlines = []  # heap of (bucket end, symbol, interval, start)
+        self.watermark = float("-inf")
+        self.late_trades = 0
         self.bars_to_save = []
 
-    def _round_time(self, dt):
-        return dt.replace(second=0, microsecond=0)
+    def _advance(self, watermark):
+        if watermark > self.watermark:
+            self.watermark = watermark
 
     async def add_trade(self, trade):
         symbol = trade.symbol
         price = trade.price
         volume = trade.size
-        ts = trade.timestamp.replace(tzinfo=pytz.UTC)
-        bucket = self._round_time(ts)
-
-        candle = self.current_candles.get(symbol)
-
-        if candle and candle[0] != bucket:
-            # Emit previous bar
-            self.bars_to_save.append(candle[1])
-            self.current_candles.pop(symbol)
-
-        # if candle and (ts - candle[0]) > timedelta(seconds=10):
-        #     self.bars_to_save.append(candle[1])
-        #     self.current_candles.pop(symbol)
-
-
-        if symbol not in self.current_candles:
-            self.current_candles[symbol] = (bucket, {
-                "symbol": symbol,
-                "datetime": bucket,
-                "open": price,
-                "high": price,
-                "low": price,
-                "close": price,
-                "volume": volume,
-            })
-            print(f"[DEBUG] Added trade to {symbol}: {price} x {volume} at {bucket}")
-        else:
-            bar = self.current_candles[symbol][1]
-            bar["high"] = max(bar["high"], price)
-            bar["low"] = min(bar["low"], price)
-            bar["close"] = price
-            bar["volume"] += volume
-
-    def pop_ready_bars(self):
-        now = datetime.utcnow().replace(second=0, microsecond=0, tzinfo=pytz.UTC)
-        expired_symbols = []
-
-        for symbol, (start_time, bar) in self.current_candles.items():
-            if now > start_time + self.interval:
-                self.bars_to_save.append(bar)
-                expired_symbols.append(symbol)
-
-        for symbol in expired_symbols:
-            self.current_candles.pop(symbol)
-
-        bars = self.bars_to_save[:]
+        ts = trade.timestamp.replace(tzinfo=pytz.UTC).timestamp()
+
+        self._advance(ts - self.lateness)
+
+        # Late in one interval means late in all of them
+        if min(ts - ts % interval + interval for interval in self.intervals) <= self.watermark:
+            self.late_trades += 1
+            return
+
+        for interval in self.intervals:
+            start = int(ts - ts % interval)
+            end = start + interval
+            key = (symbol, interval, start)
+            candle = self.current_candles.get(key)
+
+            if candle is None:
+                self.current_candles[key] = Candle(start, price, volume)
+                heapq.heappush(self.deadlines, (end, symbol, interval, start))
+            else:
+                candle.add(price, volume)
+
+    def pop_ready_bars(self, now=None):
+        """
+        Return every bar whose bucket has closed.
+
+        Pass the wall clock as `now` (epoch seconds or datetime) to close bars
+        once the stream has been quiet for `idle_lateness`; otherwise only
+        trade timestamps move the watermark.
+        """
+        if now is not None:
+            if isinstance(now, datetime):
+                now = now.timestamp()
+            self._advance(now - self.idle_lateness)
+
+        deadlines = self.deadlines
+        while deadlines and deadlines[0][0] <= self.watermark:
+            _, symbol, interval, start = heapq.heappop(deadlines)
+            candle = self.current_candles.pop((symbol, interval, start))
+            self.bars_to_save.append(candle.to_bar(symbol, interval))
+
+        bars = self.bars_to_save
         self.bars_to_save = []
         return bars
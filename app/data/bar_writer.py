@@ -0,0 +1,145 @@
+import asyncio
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+from db.database import async_session_maker
+from db.bulk import upsert_prices
+
+# SQLSTATE classes worth waiting out: connection exceptions, transaction
+# rollbacks (deadlocks, serialization failures), insufficient resources and
+# operator intervention such as an admin shutdown
+TRANSIENT_SQLSTATES = ("08", "40", "53", "57")
+
+def _is_transient(error):
+    if isinstance(error, (OperationalError, InterfaceError)):
+        return True
+    if isinstance(error, DBAPIError):
+        if error.connection_invalidated:
+            return True
+        code = getattr(error.orig, "sqlstate", None) or getattr(error.orig, "pgcode", None) or ""
+        return code[:2] in TRANSIENT_SQLSTATES
+    # Includes ConnectionError and timeouts reaching the database
+    return isinstance(error, (OSError, asyncio.TimeoutError))
+
+class BarWriter:
+    """
+    Buffered writer between the stream callbacks and Postgres.
+
+    Rows are queued with `put` and written in batches of up to `batch_size`,
+    or whatever has arrived `max_delay` seconds after the first row of a batch.
+    The queue is bounded, so `put` blocks (backpressure) once `max_pending`
+    rows are waiting on the database. `stop` drains the queue before returning.
+
+    A batch that fails on a transient error (lost connection, deadlock,
+    timeout) is retried with exponential backoff capped at `max_backoff`
+    seconds until it lands. Meanwhile the queue fills and `put` blocks, so a
+    database outage holds the stream back instead of losing bars. Only once
+    `stop` has been called does a batch give up, after `retries` attempts.
+
+    Any other error (bad data, a constraint violation) would fail the same
+    way forever, so the batch is split in halves and each is written on its
+    own until only the offending rows are left; those are logged and dropped.
+
+    `on_flush`, if given, is awaited with the rows of each batch once they are committed.
+    Its failures are logged and never cost the bars themselves.
+
+    With `dry_run` batches are formed and timed the same way but never
+    reach the database, for replays that must not touch live tables.
+    """
+
+    def __init__(self, batch_size=1000, max_delay=1.0, max_pending=50000, retries=3, max_backoff=30.0, on_flush=None, dry_run=False):
+        self.batch_size = batch_size
+        self.on_flush = on_flush
+        self.dry_run = dry_run
+        self.max_delay = max_delay
+        self.retries = retries
+        self.max_backoff = max_backoff
+        self._stopping = False
+        self.queue = asyncio.Queue(maxsize=max_pending)
+        self.written = 0
+        self.dropped = 0
+        self._task = None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def put(self, row):
+        await self.queue.put(row)
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stopping = True
+        await self.queue.put(None)
+        await self._task
+        self._task = None
+        self._stopping = False
+        print(f"Bar writer stopped, {self.written} rows written, {self.dropped} dropped")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+
+        while not stopping:
+            row = await self.queue.get()
+            if row is None:
+                break
+
+            batch = [row]
+            deadline = loop.time() + self.max_delay
+
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    row = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if row is None:
+                    stopping = True
+                    break
+                batch.append(row)
+
+            await self._flush(batch)
+
+    async def _flush(self, batch):
+        written = await self._write(batch)
+        if written and self.on_flush is not None:
+            try:
+                await self.on_flush(written)
+            except Exception as e:
+                print(f"Bar writer on_flush hook failed: {e}")
+
+    async def _write(self, batch):
+        """Write `batch`, or as much of it as will go. Returns the rows that landed."""
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                if self.dry_run:
+                    count = len(batch)
+                else:
+                    async with async_session_maker() as session:
+                        count = await upsert_prices(session, batch)
+                        await session.commit()
+                self.written += count
+                print(f"Inserted {count} bars")
+                return batch
+            except Exception as e:
+                if not _is_transient(e):
+                    return await self._split(batch, e)
+                if self._stopping and attempt >= self.retries:
+                    print(f"Dropping {len(batch)} bars after {attempt} failed attempts during shutdown: {e}")
+                    self.dropped += len(batch)
+                    return []
+                delay = min(self.max_backoff, 2 ** (attempt - 1))
+                print(f"Bar write failed (attempt {attempt}), retrying in {delay}s: {e}")
+                await asyncio.sleep(delay)
+
+    async def _split(self, batch, error):
+        if len(batch) == 1:
+            print(f"Dropping bar {batch[0]}: {error}")
+            self.dropped += 1
+            return []
+        middle = len(batch) // 2
+        return await self._write(batch[:middle]) + await self._write(batch[middle:])
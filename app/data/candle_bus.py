@@ -0,0 +1,84 @@
+import os
+import socket
+import struct
+import redis.asyncio as redis
+from redis.exceptions import ResponseError
+from data.codec import encode_bar, decode_bar
+
+# Candles are handed from the trade stream to the writers over a Redis Stream.
+# The old "candles" key is a list, so the stream lives under its own key.
+STREAM = "candles:stream"
+GROUP = "candle-writers"
+MAXLEN = 1_000_000
+
+# Messages that cannot be decoded are parked here and acked, so one bad
+# payload never blocks the group by being reclaimed over and over
+DEAD_LETTER = "candles:dead"
+
+# Payloads are binary (see data/codec.py), so responses must not be decoded
+bus = redis.Redis(host="redis", port=6379)
+
+def consumer_name():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+async def _decode(messages, client):
+    bars = []
+    bad = []
+    for message_id, fields in messages:
+        try:
+            bars.append((message_id, decode_bar(fields[b"bar"])))
+        except (KeyError, ValueError, struct.error) as e:
+            bad.append((message_id, fields, e))
+
+    if bad:
+        pipe = client.pipeline(transaction=False)
+        for message_id, fields, error in bad:
+            pipe.xadd(DEAD_LETTER, {**fields, b"id": message_id, b"error": str(error)}, maxlen=MAXLEN, approximate=True)
+        pipe.xack(STREAM, GROUP, *(message_id for message_id, _, _ in bad))
+        await pipe.execute()
+        print(f"Moved {len(bad)} undecodable candle messages to {DEAD_LETTER}: {bad[0][2]}")
+    return bars
+
+async def publish_bars(bars, client=bus, stream=STREAM):
+    """XADD every bar to `stream` in a single pipelined round-trip. Bars need an asset_id."""
+    if not bars:
+        return 0
+    pipe = client.pipeline(transaction=False)
+    for bar in bars:
+        pipe.xadd(stream, {"bar": encode_bar(bar)}, maxlen=MAXLEN, approximate=True)
+    await pipe.execute()
+    return len(bars)
+
+async def ensure_group(client=bus):
+    try:
+        await client.xgroup_create(STREAM, GROUP, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+async def read_bars(consumer, count=5000, block=None, client=bus):
+    """Read up to `count` new bars for this consumer. Returns [(id, bar)]."""
+    response = await client.xreadgroup(GROUP, consumer, {STREAM: ">"}, count=count, block=block)
+    bars = []
+    for _, messages in response or []:
+        bars.extend(await _decode(messages, client))
+    return bars
+
+async def claim_stale(consumer, min_idle_ms=60_000, count=5000, client=bus):
+    """
+    Take over bars another consumer read but never acked (it crashed or was
+    killed mid-write). Returns [(id, bar)].
+    """
+    bars = []
+    start = "0-0"
+    while True:
+        start, messages, *_ = await client.xautoclaim(
+            STREAM, GROUP, consumer, min_idle_ms, start_id=start, count=count
+        )
+        bars.extend(await _decode([m for m in messages if m[1]], client))
+        if start == b"0-0":
+            return bars
+
+async def ack(message_ids, client=bus):
+    if message_ids:
+        await client.xack(STREAM, GROUP, *message_ids)
@@ -0,0 +1,68 @@
+import json
+import struct
+from datetime import datetime, timedelta, timezone
+
+# Wire format for candle messages on the Redis bus, little-endian, 69 bytes:
+#   version u8 | asset_id u32 | interval s u32 | start epoch ns i64 |
+#   open f64 | high f64 | low f64 | close f64 | volume f64 |
+#   trade_count u32 | vwap f64
+# Bump BAR_VERSION and add a new struct whenever the layout changes; decode
+# keeps reading older versions so a rolling deploy never strands messages.
+BAR_VERSION = 1
+BAR_V1 = struct.Struct("<BIIqdddddId")
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def to_epoch_ns(dt):
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return (dt - EPOCH) // timedelta(microseconds=1) * 1000
+
+def from_epoch_ns(ns):
+    return EPOCH + timedelta(microseconds=ns // 1000)
+
+def encode_bar(bar):
+    """Pack a bar dict (asset_id already resolved) into bytes."""
+    return BAR_V1.pack(
+        BAR_VERSION,
+        bar["asset_id"],
+        bar.get("interval", 60),
+        to_epoch_ns(bar["datetime"]),
+        bar["open"],
+        bar["high"],
+        bar["low"],
+        bar["close"],
+        bar["volume"],
+        bar.get("trade_count", 0),
+        bar.get("vwap", bar["close"]),
+    )
+
+def decode_bar(payload):
+    """Unpack bytes from encode_bar into a bar dict with a UTC datetime."""
+    if not payload:
+        raise ValueError("Empty bar payload")
+    version = payload[0]
+
+    if version == 1:
+        (_, asset_id, interval, start_ns, open_, high, low, close,
+         volume, trade_count, vwap) = BAR_V1.unpack(payload)
+        return {
+            "asset_id": asset_id,
+            "interval": interval,
+            "datetime": from_epoch_ns(start_ns),
+            "open": open_,
+            "high": high,
+            "low": low,
+            "close": close,
+            "volume": volume,
+            "trade_count": trade_count,
+            "vwap": vwap,
+        }
+
+    if payload[:1] == b"{":
+        # JSON bars queued before the binary format existed
+        bar = json.loads(payload)
+        bar["datetime"] = datetime.fromisoformat(bar["datetime"])
+        return bar
+
+    raise ValueError(f"Unknown bar message version: {version}")
@@ -0,0 +1,163 @@
+import argparse
+import asyncio
+import json
+import os
+import numpy as np
+import pandas as pd
+from db.database import async_session_maker
+from db.timeframes import get_bars, parse_timeframe
+from data.symbols import registry
+
+PRICE_CACHE_ROOT = os.environ.get("PRICE_CACHE_ROOT", "/var/lib/tradeforge/prices")
+
+# One raw little-endian file per column. Datetimes are naive US/Eastern like
+# asset_price, stored as datetime64[ns] ticks.
+COLUMNS = {
+    "datetime": np.dtype("<i8"),
+    "open": np.dtype("<f8"),
+    "high": np.dtype("<f8"),
+    "low": np.dtype("<f8"),
+    "close": np.dtype("<f8"),
+    "volume": np.dtype("<i8"),
+}
+
+class PriceCache:
+    """
+    Local columnar copy of asset_price and its aggregates for research and backtests.
+
+    Each symbol and timeframe lives in `root/TIMEFRAME/SYMBOL/` as one file per
+    column plus meta.json with the row count. `read` returns np.memmap views,
+    so nothing is copied or parsed until the data is touched. `sync` appends
+    whatever the database has past the last cached bar.
+    """
+
+    def __init__(self, root=PRICE_CACHE_ROOT):
+        self.root = root
+
+    def _dir(self, symbol, timeframe):
+        return os.path.join(self.root, timeframe, symbol)
+
+    def _meta(self, directory):
+        try:
+            with open(os.path.join(directory, "meta.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"rows": 0, "last": None}
+
+    def _column(self, directory, column, rows):
+        if rows == 0:
+            return np.empty(0, dtype=COLUMNS[column])
+        return np.memmap(os.path.join(directory, f"{column}.bin"), dtype=COLUMNS[column], mode="r", shape=(rows,))
+
+    def read(self, symbol, timeframe="1m", start=None, end=None):
+        """
+        {column: array} for bars in [start, end), as read-only views on the files.
+
+        `datetime` comes back as datetime64[ns]. Only meta.json's row count is
+        mapped, so an append in progress is never visible half written.
+        """
+        directory = self._dir(symbol, timeframe)
+        rows = self._meta(directory)["rows"]
+        columns = {column: self._column(directory, column, rows) for column in COLUMNS}
+        columns["datetime"] = columns["datetime"].view("datetime64[ns]")
+
+        lo, hi = 0, rows
+        if start is not None:
+            lo = np.searchsorted(columns["datetime"], np.datetime64(start, "ns"))
+        if end is not None:
+            hi = np.searchsorted(columns["datetime"], np.datetime64(end, "ns"))
+        return {column: values[lo:hi] for column, values in columns.items()}
+
+    def frame(self, symbol, timeframe="1m", start=None, end=None):
+        """read() as a DataFrame indexed by datetime, without copying the columns."""
+        columns = self.read(symbol, timeframe, start, end)
+        index = pd.DatetimeIndex(columns.pop("datetime"), name="datetime", copy=False)
+        return pd.DataFrame(columns, index=index, copy=False)
+
+    def append(self, symbol, timeframe, columns):
+        """
+        Write new bars, replacing any cached bars at or after the first new one.
+
+        The newest bucket of an aggregate is still filling in, so each sync
+        re-fetches it and overwrites it here instead of duplicating it.
+        """
+        if len(columns["datetime"]) == 0:
+            return 0
+
+        directory = self._dir(symbol, timeframe)
+        os.makedirs(directory, exist_ok=True)
+        meta = self._meta(directory)
+
+        existing = self._column(directory, "datetime", meta["rows"])
+        keep = int(np.searchsorted(existing, columns["datetime"][0]))
+        del existing
+
+        rows = keep + len(columns["datetime"])
+
+        for column, dtype in COLUMNS.items():
+            path = os.path.join(directory, f"{column}.bin")
+            # Overwrite in place and never truncate: shrinking a file under a
+            # reader's mapping would fault on the lost pages. Bytes past
+            # `rows` are left as they are; meta.json bounds what readers map.
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            with os.fdopen(fd, "r+b") as f:
+                f.seek(keep * dtype.itemsize)
+                f.write(np.ascontiguousarray(columns[column], dtype=dtype).tobytes())
+
+        meta = {"rows": rows, "last": int(columns["datetime"][-1])}
+        with open(os.path.join(directory, "meta.json.tmp"), "w") as f:
+            json.dump(meta, f)
+        os.replace(os.path.join(directory, "meta.json.tmp"), os.path.join(directory, "meta.json"))
+        return len(columns["datetime"])
+
+    def last(self, symbol, timeframe):
+        last = self._meta(self._dir(symbol, timeframe))["last"]
+        return None if last is None else pd.Timestamp(last).to_pydatetime()
+
+def _columns(rows):
+    # Rows from get_bars → contiguous typed arrays, one pass per column
+    values = list(zip(*rows))
+    return {
+        "datetime": np.array(values[0], dtype="datetime64[ns]").view("<i8"),
+        "open": np.array(values[1], dtype="<f8"),
+        "high": np.array(values[2], dtype="<f8"),
+        "low": np.array(values[3], dtype="<f8"),
+        "close": np.array(values[4], dtype="<f8"),
+        "volume": np.array(values[5], dtype="<i8"),
+    }
+
+async def sync(cache, symbols, timeframe="1m", page_size=500_000):
+    """Bring each symbol's cached bars up to date with the database."""
+    parse_timeframe(timeframe)
+    asset_ids = await registry.get_many(symbols)
+    written = 0
+
+    async with async_session_maker() as session:
+        for symbol, asset_id in asset_ids.items():
+            start = cache.last(symbol, timeframe)
+            while True:
+                rows = await get_bars(session, asset_id, timeframe, start=start, limit=page_size)
+                if not rows:
+                    break
+                await asyncio.to_thread(cache.append, symbol, timeframe, _columns(rows))
+                written += len(rows)
+                if len(rows) < page_size:
+                    break
+                start = rows[-1].datetime
+
+    print(f"Price cache: {written} {timeframe} bars synced for {len(asset_ids)} symbols")
+    return written
+
+async def main(timeframe, symbols):
+    if not symbols:
+        from data.subscriptions import get_stream_symbols
+        symbols = sorted(await get_stream_symbols())
+    await sync(PriceCache(), symbols, timeframe)
+
+if __name__ == "__main__":
+    # python data/price_cache.py 1d AAPL MSFT
+    parser = argparse.ArgumentParser(description="Sync the local price cache from Postgres")
+    parser.add_argument("timeframe", nargs="?", default="1m")
+    parser.add_argument("symbols", nargs="*", help="defaults to the watchlist and strategy symbols")
+    args = parser.parse_args()
+    asyncio.run(main(args.timeframe, args.symbols))
@@ -0,0 +1,255 @@
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import shutil
+import signal
+import tempfile
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+# Recordings are gzip'd JSON lines:
+#   {"kind": "trade" | "bar", "recv_ns": <wall clock at receipt>, "data": {...}}
+# recv_ns keeps the original spacing between messages so a replay at 1x
+# reproduces the live arrival pattern, bursts included.
+
+def _to_dict(message):
+    if hasattr(message, "model_dump"):
+        return message.model_dump(mode="json")
+    return {
+        key: value.isoformat() if isinstance(value, datetime) else value
+        for key, value in vars(message).items()
+    }
+
+def _from_dict(data):
+    message = SimpleNamespace(**data)
+    message.timestamp = datetime.fromisoformat(data["timestamp"])
+    return message
+
+class Recorder:
+    """Appends stream messages to a recording file as they arrive."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = gzip.open(path, "at", encoding="utf-8")
+        self.count = 0
+
+    def record(self, kind, message):
+        line = {"kind": kind, "recv_ns": time.time_ns(), "data": _to_dict(message)}
+        self.file.write(json.dumps(line) + "\n")
+        self.count += 1
+
+    def wrap(self, kind, handler=None):
+        """Handler that records each message, then passes it on to `handler`."""
+        async def recording_handler(message):
+            self.record(kind, message)
+            if handler is not None:
+                await handler(message)
+        return recording_handler
+
+    def close(self):
+        self.file.close()
+        print(f"Recorded {self.count} messages to {self.path}")
+
+def read_recording(path):
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        for line in file:
+            entry = json.loads(line)
+            yield entry["kind"], entry["recv_ns"], _from_dict(entry["data"])
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))
+    return sorted_values[index]
+
+def _report(latencies, skipped, elapsed):
+    latencies = sorted(latencies)
+    count = len(latencies)
+    report = {
+        "messages": count,
+        "skipped": skipped,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_per_s": round(count / elapsed, 1) if elapsed else 0.0,
+        "latency_p50_ms": round(_percentile(latencies, 50) * 1000, 3),
+        "latency_p95_ms": round(_percentile(latencies, 95) * 1000, 3),
+        "latency_p99_ms": round(_percentile(latencies, 99) * 1000, 3),
+        "latency_max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+    }
+    print(json.dumps(report, indent=2))
+    return report
+
+async def replay(path, handlers, speed=1.0, on_due=None):
+    """
+    Feed a recording through `handlers` ({"trade": fn, "bar": fn}).
+
+    `speed` scales the recorded spacing (1 = real time, 10 = ten times
+    faster); None replays as fast as the handlers allow. Latency is measured
+    from when a message was due to be delivered until its handler returned,
+    so it includes any lag from handlers falling behind.
+
+    Handlers that only queue work (the bar writer) return long before it is
+    done. For those pass `on_due`, which is called with each message's due
+    time just before its handler runs, and time completion on that side.
+
+    Returns (handler latencies, skipped messages, elapsed seconds).
+    """
+    latencies = []
+    skipped = 0
+    first_recv = None
+    start = time.perf_counter()
+
+    for kind, recv_ns, message in read_recording(path):
+        handler = handlers.get(kind)
+        if handler is None:
+            skipped += 1
+            continue
+
+        if first_recv is None:
+            first_recv = recv_ns
+
+        if speed:
+            due = start + (recv_ns - first_recv) / 1e9 / speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        else:
+            due = time.perf_counter()
+
+        if on_due is not None:
+            on_due(due)
+        await handler(message)
+        latencies.append(time.perf_counter() - due)
+
+    return latencies, skipped, time.perf_counter() - start
+
+async def _record(path, kind):
+    from data.subscriptions import SubscriptionManager
+
+    recorder = Recorder(path)
+    manager = SubscriptionManager(recorder.wrap(kind.rstrip("s")), kind=kind)
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, manager.stop)
+
+    try:
+        await manager.run()
+    finally:
+        recorder.close()
+
+async def _replay_trades(path, speed, save, tick_root):
+    from data import stream_trades
+    from data.candle_bus import STREAM, bus
+    from data.tick_store import TickStore
+
+    # The live tick store is append-only, so replayed trades go to a scratch
+    # root unless one is named
+    scratch = tick_root is None
+    tick_root = tick_root or tempfile.mkdtemp(prefix="replay-ticks-")
+    stream_trades.tick_store = TickStore(tick_root)
+
+    # Candles go to a scratch stream the writers never read, unless --save
+    # asks for them to be written through the live one
+    stream = STREAM if save else f"candles:replay:{os.getpid()}"
+
+    # Close bars on event time only, exactly as the live flush loop would
+    async def handle_trade(trade):
+        await stream_trades.handle_trade(trade)
+        bars = stream_trades.aggregator.pop_ready_bars()
+        if bars:
+            await stream_trades.publish_ready(bars, stream)
+
+    _report(*await replay(path, {"trade": handle_trade}, speed))
+
+    await stream_trades.tick_store.flush()
+    if scratch:
+        shutil.rmtree(tick_root, ignore_errors=True)
+    else:
+        print(f"Replayed ticks written to {tick_root}")
+    bars = stream_trades.aggregator.pop_ready_bars(now=float("inf"))
+    if bars:
+        await stream_trades.publish_ready(bars, stream)
+
+    if not save:
+        print(f"Replayed {await bus.xlen(stream)} candles to scratch stream {stream}")
+        await bus.delete(stream)
+    else:
+        from tasks.tasks import _save
+
+        start = time.perf_counter()
+        await _save()
+        print(f"tasks._save drained the candle stream in {time.perf_counter() - start:.3f}s")
+
+async def _replay_bars(path, speed, save):
+    from data import stream_minute_bars
+    from data.bar_writer import BarWriter
+    from indicators.streaming import IndicatorEngine
+
+    # Without --save the same batching and indicator work runs, but neither
+    # the bars nor their indicator rows are written
+    if not save:
+        engine = IndicatorEngine(dry_run=True)
+        stream_minute_bars.writer = BarWriter(on_flush=engine.update, dry_run=True)
+
+    # Latency runs from a bar's due time until the batch holding it is
+    # committed: put() tags each row with the due time of the message being
+    # handled, on_flush() reads the tags back after the commit
+    writer = stream_minute_bars.writer
+    current = {}
+    dues = {}
+    latencies = []
+
+    put = writer.put
+    async def timed_put(row):
+        dues[id(row)] = current["due"]
+        await put(row)
+
+    on_flush = writer.on_flush
+    async def timed_flush(batch):
+        now = time.perf_counter()
+        latencies.extend(now - dues.pop(id(row)) for row in batch if id(row) in dues)
+        if on_flush is not None:
+            await on_flush(batch)
+
+    writer.put = timed_put
+    writer.on_flush = timed_flush
+
+    await writer.start()
+    start = time.perf_counter()
+    try:
+        _, skipped, _ = await replay(path, {"bar": stream_minute_bars.on_minute_bar}, speed,
+                                     on_due=lambda due: current.update(due=due))
+    finally:
+        drain = time.perf_counter()
+        await writer.stop()
+        print(f"Bar writer drained in {time.perf_counter() - drain:.3f}s")
+
+    _report(latencies, skipped, time.perf_counter() - start)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record or replay the market data stream")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record = commands.add_parser("record", help="capture live messages to a file")
+    record.add_argument("path")
+    record.add_argument("--kind", choices=["trades", "bars"], default="trades")
+
+    play = commands.add_parser("replay", help="feed a recording through the stream handlers")
+    play.add_argument("path")
+    play.add_argument("--kind", choices=["trades", "bars"], default="trades")
+    play.add_argument("--speed", type=float, default=1.0, help="playback multiplier, 0 for max speed")
+    play.add_argument("--save", action="store_true",
+                      help="write through the live candle stream and tables (trades: also run tasks._save); default is a dry run")
+    play.add_argument("--tick-root", help="keep replayed trades in this tick store (default: a scratch dir, removed afterwards)")
+
+    args = parser.parse_args()
+
+    if args.command == "record":
+        asyncio.run(_record(args.path, args.kind))
+    elif args.kind == "trades":
+        asyncio.run(_replay_trades(args.path, args.speed or None, args.save, args.tick_root))
+    else:
+        asyncio.run(_replay_bars(args.path, args.speed or None, args.save))
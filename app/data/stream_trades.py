@@ -1,40 +1,66 @@
-from alpaca.data.live import StockDataStream
-from aggregator import CandleAggregator
+from data.aggregator import CandleAggregator
+from data.candle_bus import STREAM, publish_bars
+from data.symbols import registry
+from data.subscriptions import SubscriptionManager
+from data.tick_store import TickStore
 from config import *
-import asyncio, json
+from datetime import timedelta
+import asyncio, os, signal, time
 
-redis_client = redis.Redis(host="redis", port=6379, decode_responses=True)
+# Only minute candles are built: asset_price holds minute bars and the
+# coarser timeframes come from its continuous aggregates, so the writers
+# have no use for 5m/15m/1h candles on the stream
+aggregator = CandleAggregator(intervals=(timedelta(minutes=1),))
 
-
-# Initialize the in-memory candle aggregator (1-minute candles)
-aggregator = CandleAggregator(interval=60)
-
-# Initialize the StockDataStream
-stock_stream = StockDataStream(ALPACA_KEY, ALPACA_SECRET)
+# Raw trades are kept too, rolled into Parquet segments per symbol and day
+tick_store = TickStore()
 
 # Define the trade handler
 async def handle_trade(trade):
     await aggregator.add_trade(trade)
-    
-    print(f"[TRADE] {trade.symbol} {trade.price} x {trade.size} at {trade.timestamp}")
+    tick_store.append(trade)
+
+async def publish_ready(bars, stream=STREAM):
+    # Resolve ids here so the writers never need the symbol
+    asset_map = await registry.get_many({bar["symbol"] for bar in bars})
+    for bar in bars:
+        bar["asset_id"] = asset_map.get(bar["symbol"])
+    bars = [bar for bar in bars if bar["asset_id"]]
+
+    await publish_bars(bars, stream=stream)
+    return len(bars)
 
 async def flush_loop():
     while True:
-        await asyncio.sleep(60)  # check every 5 seconds
-        bars = aggregator.pop_ready_bars()
-        for bar in bars:
-            await redis_client.rpush("candles", json.dumps(bar))
-            print(f"Pushed candle to Redis: {bar['symbol']} @ {bar['datetime']}")
+        await asyncio.sleep(1)  # only expired candles are touched, so flush often
+
+        if tick_store.due():
+            await tick_store.flush()
+
+        bars = aggregator.pop_ready_bars(now=time.time())
+        if bars:
+            count = await publish_ready(bars)
+            print(f"Pushed {count} candles to Redis")
+
+# Run the trade subscriptions and the flush loop on the same event loop
+async def main():
+    # Subscriptions follow the watchlist and strategy tables
+    manager = SubscriptionManager(handle_trade, kind="trades", shards=int(os.environ.get("STREAM_SHARDS", 1)))
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, manager.stop)
 
-# Subscribe to trade updates for specific symbols
-stock_stream.subscribe_trades(handle_trade, "QQQ", "SPY")
+    flusher = asyncio.create_task(flush_loop())
+    try:
+        await manager.run()
+    finally:
+        flusher.cancel()
+        await tick_store.flush()
 
-# Run the stream
 def start_stream():
-    loop = asyncio.get_event_loop()
-    loop.create_task(flush_loop())
-    stock_stream.run()
+    asyncio.run(main())
 
 # Optionally call this from main.py or a background task
 if __name__ == "__main__":
-    start_stream()
\ No newline at end of file
+    start_stream()
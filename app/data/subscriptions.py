@@ -0,0 +1,113 @@
+import asyncio
+import threading
+import zlib
+from alpaca.data.live import StockDataStream
+from sqlalchemy.future import select
+from config import ALPACA_KEY, ALPACA_SECRET, redis_client
+from db.models import Asset, AssetStrategy, WatchList
+from db.database import async_session_maker
+
+# Published by the web routes whenever the watchlist or a strategy link changes
+WATCHLIST_CHANNEL = "watchlist:updates"
+
+async def notify_watchlist_changed():
+    await redis_client.publish(WATCHLIST_CHANNEL, "changed")
+
+async def get_stream_symbols():
+    """Symbols on the watchlist or attached to a strategy."""
+    async with async_session_maker() as session:
+        watchlist = select(Asset.symbol).join(WatchList, WatchList.asset_id == Asset.id)
+        strategies = select(Asset.symbol).join(AssetStrategy, AssetStrategy.asset_id == Asset.id)
+        result = await session.execute(watchlist.union(strategies))
+        return {row[0] for row in result}
+
+def shard_for(symbol, shards):
+    # crc32 rather than hash() so a symbol lands on the same shard every run
+    return zlib.crc32(symbol.encode()) % shards
+
+class SubscriptionManager:
+    """
+    Keeps Alpaca stream subscriptions in line with the watchlist and strategy tables.
+
+    Symbols are spread over `shards` StockDataStream connections, each running
+    on its own thread. Messages are handed back to `handler` on the caller's
+    event loop, and the shard waits for it, so a slow handler pushes back on
+    the socket. Subscriptions are re-synced on every WATCHLIST_CHANNEL message
+    and every `refresh_interval` seconds as a fallback.
+
+    Note that Alpaca caps concurrent websocket connections per account, so
+    more than one shard needs a plan that allows it.
+    """
+
+    def __init__(self, handler, kind="bars", shards=1, refresh_interval=60):
+        self.handler = handler
+        self.kind = kind
+        self.refresh_interval = refresh_interval
+        self.streams = [StockDataStream(ALPACA_KEY, ALPACA_SECRET) for _ in range(shards)]
+        self.symbols = set()
+        self.loop = None
+        self._stopped = None
+
+    async def _dispatch(self, message):
+        # Runs on the shard's loop; the handler runs on the manager's loop
+        future = asyncio.run_coroutine_threadsafe(self.handler(message), self.loop)
+        await asyncio.wrap_future(future)
+
+    def _by_shard(self, symbols):
+        shards = {}
+        for symbol in symbols:
+            shards.setdefault(shard_for(symbol, len(self.streams)), []).append(symbol)
+        return shards
+
+    async def sync(self):
+        wanted = await get_stream_symbols()
+        added = wanted - self.symbols
+        removed = self.symbols - wanted
+
+        # subscribe/unsubscribe block on the shard's loop once it is running
+        for shard, symbols in self._by_shard(added).items():
+            subscribe = getattr(self.streams[shard], f"subscribe_{self.kind}")
+            await asyncio.to_thread(subscribe, self._dispatch, *symbols)
+
+        for shard, symbols in self._by_shard(removed).items():
+            unsubscribe = getattr(self.streams[shard], f"unsubscribe_{self.kind}")
+            await asyncio.to_thread(unsubscribe, *symbols)
+
+        self.symbols = wanted
+
+        if added or removed:
+            print(f"Stream {self.kind}: +{len(added)} -{len(removed)}, {len(wanted)} symbols on {len(self.streams)} shards")
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+
+        await self.sync()
+        if not self.symbols:
+            print("No symbols on the watchlist yet, waiting for changes")
+
+        for stream in self.streams:
+            threading.Thread(target=stream.run, daemon=True).start()
+
+        pubsub = redis_client.pubsub()
+        await pubsub.subscribe(WATCHLIST_CHANNEL)
+        try:
+            stopped = asyncio.create_task(self._stopped.wait())
+            while not self._stopped.is_set():
+                # Wakes on a change notification, after the poll interval, or on stop()
+                message = asyncio.create_task(
+                    pubsub.get_message(ignore_subscribe_messages=True, timeout=self.refresh_interval)
+                )
+                await asyncio.wait({message, stopped}, return_when=asyncio.FIRST_COMPLETED)
+                if self._stopped.is_set():
+                    message.cancel()
+                    break
+                await self.sync()
+        finally:
+            await pubsub.unsubscribe(WATCHLIST_CHANNEL)
+            for stream in self.streams:
+                await asyncio.to_thread(stream.stop)
+
+    def stop(self):
+        if self._stopped is not None:
+            self._stopped.set()
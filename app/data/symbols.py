@@ -0,0 +1,97 @@
+import asyncio
+import time
+from sqlalchemy.future import select
+from config import redis_client
+from db.models import Asset
+from db.database import async_session_maker
+
+# Bumped by populate_assets whenever new rows land in the asset table
+ASSET_VERSION_KEY = "assets:version"
+
+class SymbolRegistry:
+    """
+    Process-wide symbol -> asset_id map.
+
+    The full asset table is read once; after that lookups are plain dict hits.
+    New assets are picked up incrementally (id > max_id) when the Redis
+    version counter moves, which is only checked on a lookup miss and at most
+    once every `check_interval` seconds.
+    """
+
+    def __init__(self, check_interval=5.0):
+        self.ids = {}
+        self.max_id = 0
+        self.version = None
+        self.check_interval = check_interval
+        self._loaded = False
+        self._last_check = 0.0
+        self._lock = asyncio.Lock()
+
+    async def _fetch(self, min_id=0):
+        async with async_session_maker() as session:
+            result = await session.execute(
+                select(Asset.id, Asset.symbol).where(Asset.id > min_id)
+            )
+            return result.all()
+
+    async def load(self):
+        async with self._lock:
+            if self._loaded:
+                return
+            self.version = await redis_client.get(ASSET_VERSION_KEY)
+            self._apply(await self._fetch())
+            self._loaded = True
+            self._last_check = time.monotonic()
+            print(f"Symbol registry loaded {len(self.ids)} assets")
+
+    async def refresh(self):
+        """Pull only assets inserted since the last load."""
+        async with self._lock:
+            self.version = await redis_client.get(ASSET_VERSION_KEY)
+            rows = await self._fetch(self.max_id)
+            self._apply(rows)
+            self._last_check = time.monotonic()
+            if rows:
+                print(f"Symbol registry added {len(rows)} assets")
+
+    def _apply(self, rows):
+        for asset_id, symbol in rows:
+            self.ids[symbol] = asset_id
+            if asset_id > self.max_id:
+                self.max_id = asset_id
+
+    async def sync(self):
+        """Refresh if populate_assets has bumped the version since our last look."""
+        if time.monotonic() - self._last_check < self.check_interval:
+            return
+        self._last_check = time.monotonic()
+        version = await redis_client.get(ASSET_VERSION_KEY)
+        if version != self.version:
+            await self.refresh()
+
+    async def get(self, symbol):
+        if not self._loaded:
+            await self.load()
+        asset_id = self.ids.get(symbol)
+        if asset_id is None:
+            await self.sync()
+            asset_id = self.ids.get(symbol)
+        return asset_id
+
+    async def get_many(self, symbols):
+        if not self._loaded:
+            await self.load()
+        if any(symbol not in self.ids for symbol in symbols):
+            await self.sync()
+        return {symbol: self.ids[symbol] for symbol in symbols if symbol in self.ids}
+
+    async def mapping(self):
+        if not self._loaded:
+            await self.load()
+        return self.ids
+
+async def bump_asset_version():
+    """Tell every running registry that new assets exist."""
+    return await redis_client.incr(ASSET_VERSION_KEY)
+
+registry = SymbolRegistry()
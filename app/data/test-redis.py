@@ -1,4 +1,6 @@
-import redis, json
-r = redis.Redis(host="redis", port=6379, decode_responses=True)
-bar = {"symbol": "AAPL", "datetime": "2024-04-04T15:00:00", "open": 100, "high": 105, "low": 95, "close": 102, "volume": 15000}
-r.rpush("candles", json.dumps(bar))
\ No newline at end of file
+import redis
+from datetime import datetime, timezone
+from data.codec import encode_bar
+r = redis.Redis(host="redis", port=6379)
+bar = {"asset_id": 1, "interval": 60, "datetime": datetime(2024, 4, 4, 19, 0, tzinfo=timezone.utc), "open": 100, "high": 105, "low": 95, "close": 102, "volume": 15000}
+r.xadd("candles:stream", {"bar": encode_bar(bar)})
\ No newline at end of file
@@ -0,0 +1,196 @@
+import asyncio
+import os
+import sys
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+from zoneinfo import ZoneInfo
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from data.codec import to_epoch_ns
+
+TICK_ROOT = os.environ.get("TICK_ROOT", "/var/lib/tradeforge/ticks")
+
+EASTERN = ZoneInfo("America/New_York")
+
+SCHEMA = pa.schema([
+    ("timestamp", pa.timestamp("ns", tz="UTC")),
+    ("price", pa.float64()),
+    ("size", pa.float64()),
+    ("exchange", pa.string()),
+    ("trade_id", pa.int64()),
+])
+
+class _Buffer:
+    """Column lists for one symbol's unwritten trades, all from one trading day."""
+
+    __slots__ = ("day", "day_end_ns", "timestamp", "price", "size", "exchange", "trade_id")
+
+    def __init__(self, day):
+        self.day = day
+        next_day = datetime.combine(day + timedelta(days=1), dt_time(), tzinfo=EASTERN)
+        self.day_end_ns = to_epoch_ns(next_day)
+        self.timestamp = []
+        self.price = []
+        self.size = []
+        self.exchange = []
+        self.trade_id = []
+
+    def table(self):
+        return pa.table({
+            "timestamp": self.timestamp,
+            "price": self.price,
+            "size": self.size,
+            "exchange": self.exchange,
+            "trade_id": self.trade_id,
+        }, schema=SCHEMA)
+
+class TickStore:
+    """
+    Append-only tick storage in compressed Parquet.
+
+    Trades are buffered per symbol in memory and rolled into immutable segment
+    files under `root/SYMBOL/YYYY-MM-DD/`. `compact` merges a finished day's
+    segments into a single `root/SYMBOL/YYYY-MM-DD.parquet`. Days follow the
+    US/Eastern calendar so a whole session, extended hours included, lands in
+    one file.
+    """
+
+    def __init__(self, root=TICK_ROOT, segment_rows=250_000, max_age=30, compression="zstd"):
+        self.root = root
+        self.segment_rows = segment_rows
+        self.max_age = max_age
+        self.compression = compression
+        self.buffers = {}  # symbol → _Buffer
+        self.pending_rows = 0
+        self.last_flush = time.monotonic()
+        self._closed = []  # (symbol, _Buffer) from days that have ended
+
+    def append(self, trade):
+        ts = to_epoch_ns(trade.timestamp)
+        buffer = self.buffers.get(trade.symbol)
+
+        if buffer is None or ts >= buffer.day_end_ns:
+            if buffer is not None:
+                self._closed.append((trade.symbol, buffer))
+            day = trade.timestamp.astimezone(EASTERN).date()
+            buffer = self.buffers[trade.symbol] = _Buffer(day)
+
+        buffer.timestamp.append(ts)
+        buffer.price.append(trade.price)
+        buffer.size.append(trade.size)
+        buffer.exchange.append(getattr(trade.exchange, "value", trade.exchange))
+        buffer.trade_id.append(trade.id)
+        self.pending_rows += 1
+
+    def _take(self):
+        # Swap buffers out on the event loop so writing can happen off it.
+        # Each symbol keeps an empty buffer for its current day.
+        closed, self._closed = self._closed, []
+        pending = [(symbol, buffer) for symbol, buffer in closed if buffer.timestamp]
+        for symbol, buffer in self.buffers.items():
+            if buffer.timestamp:
+                pending.append((symbol, buffer))
+                self.buffers[symbol] = _Buffer(buffer.day)
+        finished = [(symbol, buffer.day) for symbol, buffer in closed]
+        self.pending_rows = 0
+        self.last_flush = time.monotonic()
+        return pending, finished
+
+    def _segment_dir(self, symbol, day):
+        return os.path.join(self.root, symbol, day.isoformat())
+
+    def _day_file(self, symbol, day):
+        return os.path.join(self.root, symbol, f"{day.isoformat()}.parquet")
+
+    def _write(self, pending, finished):
+        for symbol, buffer in pending:
+            directory = self._segment_dir(symbol, buffer.day)
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"seg-{time.time_ns()}.parquet")
+            # Write then rename so readers never see a half-written segment
+            pq.write_table(buffer.table(), path + ".tmp", compression=self.compression)
+            os.replace(path + ".tmp", path)
+
+        for symbol, day in finished:
+            self.compact(symbol, day)
+
+    def due(self):
+        """True once enough rows are buffered or the oldest buffer is `max_age` seconds old."""
+        if self.pending_rows >= self.segment_rows:
+            return True
+        return self.pending_rows > 0 and time.monotonic() - self.last_flush >= self.max_age
+
+    async def flush(self):
+        """Write every buffered trade as new segments, off the event loop."""
+        pending, finished = self._take()
+        if pending or finished:
+            await asyncio.to_thread(self._write, pending, finished)
+        return sum(len(buffer.timestamp) for _, buffer in pending)
+
+    def compact(self, symbol, day):
+        """Merge a day's segments (and any earlier day file) into one sorted file."""
+        directory = self._segment_dir(symbol, day)
+        if not os.path.isdir(directory):
+            return
+
+        day_file = self._day_file(symbol, day)
+        segments = sorted(
+            os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".parquet")
+        )
+        sources = segments + ([day_file] if os.path.exists(day_file) else [])
+        if not sources:
+            os.rmdir(directory)
+            return
+
+        table = pa.concat_tables(pq.read_table(path, schema=SCHEMA) for path in sources)
+        table = table.sort_by("timestamp")
+
+        pq.write_table(table, day_file + ".tmp", compression=self.compression, row_group_size=100_000)
+        os.replace(day_file + ".tmp", day_file)
+
+        for path in segments:
+            os.remove(path)
+        os.rmdir(directory)
+
+    def _files(self, symbol, start, end):
+        day = start.astimezone(EASTERN).date()
+        last = end.astimezone(EASTERN).date()
+        while day <= last:
+            day_file = self._day_file(symbol, day)
+            if os.path.exists(day_file):
+                yield day_file
+            directory = self._segment_dir(symbol, day)
+            if os.path.isdir(directory):
+                for name in sorted(os.listdir(directory)):
+                    if name.endswith(".parquet"):
+                        yield os.path.join(directory, name)
+            day += timedelta(days=1)
+
+    def read(self, symbol, start, end, columns=None, batch_size=65_536):
+        """
+        Stream a symbol's trades in [start, end) as pyarrow RecordBatches.
+
+        `start` and `end` must be timezone-aware. Row-group statistics are used
+        to skip data outside the range. Buffered, unflushed trades are not
+        included.
+        """
+        files = list(self._files(symbol, start, end))
+        if not files:
+            return
+
+        dataset = ds.dataset(files, schema=SCHEMA, format="parquet")
+        start = pa.scalar(to_epoch_ns(start), type=SCHEMA.field("timestamp").type)
+        end = pa.scalar(to_epoch_ns(end), type=SCHEMA.field("timestamp").type)
+        flt = (ds.field("timestamp") >= start) & (ds.field("timestamp") < end)
+
+        yield from dataset.to_batches(columns=columns, filter=flt, batch_size=batch_size)
+
+def compact_all(day, root=TICK_ROOT):
+    store = TickStore(root)
+    for symbol in os.listdir(root):
+        store.compact(symbol, day)
+
+if __name__ == "__main__":
+    # python data/tick_store.py 2025-01-02
+    compact_all(date.fromisoformat(sys.argv[1]))
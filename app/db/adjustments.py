@@ -0,0 +1,131 @@
+import asyncio
+import time
+import numpy as np
+import pandas as pd
+from sqlalchemy.future import select
+from config import redis_client
+from db.models import CorporateAction
+from db.database import async_session_maker
+from db.timeframes import get_bars
+
+# Bumped by populate_actions whenever corporate_action rows change
+ACTIONS_VERSION_KEY = "corporate_actions:version"
+
+PRICE_FIELDS = ("open", "high", "low", "close")
+
+# Column order of get_bars() rows
+BAR_FIELDS = ("datetime", "open", "high", "low", "close", "volume")
+
+async def bump_actions_version():
+    """Tell every running AdjustmentCache to drop its factors."""
+    return await redis_client.incr(ACTIONS_VERSION_KEY)
+
+class AdjustmentFactors:
+    """
+    Cumulative split and dividend factors for one asset.
+
+    `price[i]` is the product of every action from the i-th ex-date on, so a
+    bar's factor is one searchsorted away: bars before the first ex-date get
+    `price[0]`, bars on or after the last get 1.
+    """
+
+    __slots__ = ("ex_dates", "price", "volume")
+
+    def __init__(self, ex_dates, price_factors, volume_factors):
+        self.ex_dates = np.asarray(ex_dates, dtype="datetime64[ns]")
+        self.price = np.append(np.cumprod(np.asarray(price_factors, dtype="f8")[::-1])[::-1], 1.0)
+        self.volume = np.append(np.cumprod(np.asarray(volume_factors, dtype="f8")[::-1])[::-1], 1.0)
+
+    def at(self, datetimes):
+        """(price, volume) factor arrays for naive US/Eastern bar datetimes."""
+        index = np.searchsorted(self.ex_dates, np.asarray(datetimes, dtype="datetime64[ns]"), side="right")
+        return self.price[index], self.volume[index]
+
+    def adjust(self, columns):
+        """
+        Adjusted copies of {column: array} as returned by PriceCache.read.
+
+        The source arrays are never written to, so read-only memory maps are fine.
+        """
+        if len(self.ex_dates) == 0:
+            return dict(columns)
+        price, volume = self.at(columns["datetime"])
+        adjusted = dict(columns)
+        for field in PRICE_FIELDS:
+            adjusted[field] = columns[field] * price
+        adjusted["volume"] = columns["volume"] * volume
+        return adjusted
+
+class AdjustmentCache:
+    """
+    Process-wide asset_id -> AdjustmentFactors.
+
+    Factors are built on first use and kept until populate_actions bumps the
+    Redis version, which is checked at most once every `check_interval` seconds.
+    """
+
+    def __init__(self, check_interval=60.0):
+        self.factors = {}
+        self.version = None
+        self.check_interval = check_interval
+        self._last_check = 0.0
+        self._lock = asyncio.Lock()
+
+    async def _sync(self):
+        if time.monotonic() - self._last_check < self.check_interval:
+            return
+        self._last_check = time.monotonic()
+        version = await redis_client.get(ACTIONS_VERSION_KEY)
+        if version != self.version:
+            self.factors.clear()
+            self.version = version
+
+    async def _load(self, asset_id):
+        async with async_session_maker() as session:
+            result = await session.execute(
+                select(CorporateAction.ex_date, CorporateAction.price_factor, CorporateAction.volume_factor)
+                .where(CorporateAction.asset_id == asset_id)
+                .order_by(CorporateAction.ex_date)
+            )
+            rows = result.all()
+        return AdjustmentFactors(
+            [row.ex_date for row in rows],
+            [row.price_factor for row in rows],
+            [row.volume_factor for row in rows],
+        )
+
+    async def get(self, asset_id):
+        async with self._lock:
+            await self._sync()
+            factors = self.factors.get(asset_id)
+            if factors is None:
+                factors = self.factors[asset_id] = await self._load(asset_id)
+            return factors
+
+adjustments = AdjustmentCache()
+
+def adjust_rows(rows, factors):
+    """get_bars() rows as adjusted dicts; returned as they are when the asset has no actions."""
+    if not rows or len(factors.ex_dates) == 0:
+        return rows
+    datetimes = [row[0] for row in rows]
+    adjusted = factors.adjust({
+        "datetime": datetimes,
+        **{field: np.array([row[i] for row in rows], dtype=np.float64) for i, field in enumerate(BAR_FIELDS[1:], 1)},
+    })
+    return [
+        dict(zip(BAR_FIELDS, values))
+        for values in zip(datetimes, *(adjusted[field].tolist() for field in BAR_FIELDS[1:]))
+    ]
+
+async def adjusted_bars(session, asset_id, timeframe="1d", start=None, end=None):
+    """get_bars() as a split- and dividend-adjusted DataFrame indexed by datetime."""
+    rows = await get_bars(session, asset_id, timeframe, start, end)
+    frame = pd.DataFrame(rows, columns=["datetime", "open", "high", "low", "close", "volume"]).set_index("datetime")
+
+    factors = await adjustments.get(asset_id)
+    if len(factors.ex_dates) and not frame.empty:
+        price, volume = factors.at(frame.index.to_numpy())
+        frame[list(PRICE_FIELDS)] = frame[list(PRICE_FIELDS)].to_numpy() * price[:, None]
+        frame["volume"] = frame["volume"].to_numpy() * volume
+    return frame
@@ -0,0 +1,155 @@
+from zoneinfo import ZoneInfo
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+from db.models import AssetPrice
+
+# asyncpg refuses statements with more than 32767 bind parameters
+MAX_PARAMS = 32767
+
+EASTERN = ZoneInfo("America/New_York")
+
+PRICE_COLUMNS = ("open", "high", "low", "close", "volume")
+PRICE_TABLE_COLUMNS = ("datetime", "asset_id") + PRICE_COLUMNS
+BAR_TABLE_COLUMNS = ("asset_id", "timeframe", "datetime") + PRICE_COLUMNS
+
+# TimeFrame.value of the bars asset_price holds; any other timeframe goes to asset_bar
+MINUTE = "1Min"
+
+async def upsert(session, model, rows, key, update=True):
+    """
+    Write rows with multi-row INSERT ... ON CONFLICT (`key`).
+
+    `rows` are dicts keyed by `model` column names. With `update` the latest
+    values win, otherwise existing rows are left alone. Does not commit.
+    """
+    if not rows:
+        return 0
+
+    # ON CONFLICT DO UPDATE cannot touch the same row twice in one statement
+    deduped = {tuple(row[column] for column in key): row for row in rows}
+    rows = list(deduped.values())
+
+    chunk_size = MAX_PARAMS // len(rows[0])
+    value_columns = [column for column in rows[0] if column not in key]
+
+    for i in range(0, len(rows), chunk_size):
+        stmt = insert(model).values(rows[i:i + chunk_size])
+        if update:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=list(key),
+                set_={column: stmt.excluded[column] for column in value_columns}
+            )
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=list(key))
+        await session.execute(stmt)
+
+    return len(rows)
+
+async def upsert_prices(session, rows, update=True):
+    """upsert() for asset_price rows."""
+    return await upsert(session, AssetPrice, rows, ("datetime", "asset_id"), update)
+
+def price_frame(bars, asset_ids, since=None):
+    """
+    Turn an Alpaca BarSet.df (MultiIndex of symbol, UTC timestamp) into
+    asset_price columns without touching individual rows.
+
+    Symbols missing from `asset_ids` are dropped. With `since`
+    ({symbol: naive Eastern datetime}) rows older than a symbol's mark are
+    dropped too.
+    """
+    if bars.empty:
+        return pd.DataFrame(columns=PRICE_TABLE_COLUMNS)
+
+    symbols = bars.index.get_level_values(0)
+    timestamps = bars.index.get_level_values(1).tz_convert(EASTERN).tz_localize(None)
+    ids = symbols.map(asset_ids)
+
+    keep = ids.notna()
+    if since:
+        marks = pd.DatetimeIndex(symbols.map(since))
+        keep &= ~(timestamps < marks)
+
+    frame = pd.DataFrame({
+        "datetime": timestamps[keep],
+        "asset_id": ids[keep].astype("int64"),
+        "open": bars["open"].to_numpy()[keep],
+        "high": bars["high"].to_numpy()[keep],
+        "low": bars["low"].to_numpy()[keep],
+        "close": bars["close"].to_numpy()[keep],
+        "volume": bars["volume"].to_numpy()[keep].astype("int64"),
+    })
+    return frame
+
+def frame_records(frame, columns):
+    # Column-wise tolist() hands asyncpg plain Python values, which it
+    # encodes far faster than numpy scalars or Timestamps
+    values = []
+    for column in columns:
+        series = frame[column]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            values.append(series.dt.to_pydatetime().tolist())
+        else:
+            values.append(series.tolist())
+    return list(zip(*values))
+
+async def copy_upsert(session, table, columns, records, key, update=True, changed_only=False):
+    """
+    Bulk load `records` (tuples in `columns` order) into `table` via COPY.
+
+    Rows are COPY'd into a temp staging table on the session's connection and
+    merged with INSERT ... SELECT ... ON CONFLICT (`key`), so loads are
+    idempotent. With `changed_only`, conflicting rows are only rewritten when
+    a value actually differs. Returns the number of rows inserted or updated.
+    Does not commit.
+    """
+    if not records:
+        return 0
+
+    staging = f"staging_{table}"
+    column_list = ", ".join(columns)
+    key_list = ", ".join(key)
+    value_columns = [column for column in columns if column not in key]
+
+    if update:
+        conflict = "DO UPDATE SET " + ", ".join(f"{column} = EXCLUDED.{column}" for column in value_columns)
+        if changed_only:
+            current = ", ".join(f"{table}.{column}" for column in value_columns)
+            incoming = ", ".join(f"EXCLUDED.{column}" for column in value_columns)
+            conflict += f" WHERE ({current}) IS DISTINCT FROM ({incoming})"
+    else:
+        conflict = "DO NOTHING"
+
+    # Only the loaded columns, without the target's constraints or defaults
+    await session.execute(text(
+        f"CREATE TEMP TABLE IF NOT EXISTS {staging} ON COMMIT DROP "
+        f"AS SELECT {column_list} FROM {table} WITH NO DATA"
+    ))
+
+    connection = await session.connection()
+    raw = await connection.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(staging, records=records, columns=list(columns))
+
+    # DISTINCT ON because ON CONFLICT cannot touch the same row twice
+    result = await session.execute(text(
+        f"INSERT INTO {table} ({column_list}) "
+        f"SELECT DISTINCT ON ({key_list}) {column_list} FROM {staging} "
+        f"ON CONFLICT ({key_list}) {conflict}"
+    ))
+    await session.execute(text(f"TRUNCATE {staging}"))
+
+    return result.rowcount
+
+async def copy_prices(session, frame, update=True, timeframe=MINUTE):
+    """
+    COPY a price_frame() of `timeframe` bars (a TimeFrame.value) into
+    asset_price, or into asset_bar unless they are minute bars, so coarser
+    bars never overwrite the minute rows the stream writes. Does not commit.
+    """
+    if timeframe == MINUTE:
+        records = frame_records(frame, PRICE_TABLE_COLUMNS)
+        return await copy_upsert(session, "asset_price", PRICE_TABLE_COLUMNS, records, ("datetime", "asset_id"), update)
+
+    records = frame_records(frame.assign(timeframe=timeframe), BAR_TABLE_COLUMNS)
+    return await copy_upsert(session, "asset_bar", BAR_TABLE_COLUMNS, records, ("asset_id", "timeframe", "datetime"), update)
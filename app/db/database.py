@@ -13,7 +13,16 @@ url = URL.create(
     port=5432
 )
 
-engine = create_async_engine(url, echo=True)
+# Long-lived processes (web, Celery workers) keep these connections open
+# between requests and tasks; pre_ping replaces any the server dropped
+engine = create_async_engine(
+    url,
+    echo=True,
+    pool_size=int(os.environ.get("DB_POOL_SIZE", 5)),
+    max_overflow=int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+    pool_pre_ping=True,
+    pool_recycle=1800,
+)
 AsyncSessionLocal = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
 
 async def get_db():
@@ -63,4 +63,7 @@
 
 -- -- CREATE INDEX ON stock_price (asset_id, datetime DESC);
 
--- -- SELECT create_hypertable('stock_price', 'dt');
\ No newline at end of file
+-- -- SELECT create_hypertable('stock_price', 'dt');
+-- asset_price is now created by SQLAlchemy and converted to a hypertable with
+-- compression and retention policies in db/schema.py (bootstrap), which runs
+-- on every web startup. This file is kept for reference only.
@@ -1,5 +1,6 @@
 from sqlalchemy import Column, Integer, Float, TIMESTAMP, String, Boolean, ForeignKey, Date, Time, DateTime, Index
 from sqlalchemy.orm import relationship
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
@@ -15,6 +16,10 @@ class Asset(Base):
     is_etf = Column(Boolean)
     is_sp500 = Column(Boolean)
 
+    __table_args__ = (
+        Index("ix_asset_symbol", "symbol", unique=True),
+    )
+
 class AssetPrice(Base):
     __tablename__ = "asset_price"
 
@@ -30,19 +35,70 @@ class AssetPrice(Base):
         Index("ix_asset_id", "asset_id", "datetime"),
     )
 
+class AssetBar(Base):
+    __tablename__ = "asset_bar"
+
+    # Bars the historical loader fetches at a coarser timeframe than
+    # asset_price's minutes; `timeframe` is Alpaca's TimeFrame.value, e.g. "1Hour"
+    asset_id = Column(ForeignKey("asset.id"), nullable=False, primary_key=True)
+    timeframe = Column(String, nullable=False, primary_key=True)
+    datetime = Column(DateTime, nullable=False, primary_key=True)
+    open = Column(Float)
+    high = Column(Float)
+    low = Column(Float)
+    close = Column(Float)
+    volume = Column(Integer)
+
+class GapCheck(Base):
+    __tablename__ = "gap_check"
+
+    # Minute ranges backfill_gaps has already fetched for an asset. Minutes
+    # still missing inside one had no trades, so they are not requested again.
+    asset_id = Column(ForeignKey("asset.id"), nullable=False, primary_key=True)
+    span_start = Column(DateTime, nullable=False, primary_key=True)
+    span_end = Column(DateTime, nullable=False)
+
+class CorporateAction(Base):
+    __tablename__ = "corporate_action"
+
+    id = Column(String, primary_key=True)  # Alpaca's corporate action id
+    asset_id = Column(ForeignKey("asset.id"), nullable=False)
+    action_type = Column(String, nullable=False)
+    ex_date = Column(Date, nullable=False)
+    old_rate = Column(Float)
+    new_rate = Column(Float)
+    cash = Column(Float)
+    # Multipliers for bars before ex_date, computed once when the action is loaded
+    price_factor = Column(Float, nullable=False)
+    volume_factor = Column(Float, nullable=False)
+
+    __table_args__ = (
+        Index("ix_corporate_action_asset", "asset_id", "ex_date"),
+    )
+
 class Indicator(Base):
     __tablename__ = "indicator"
 
     datetime = Column(DateTime, nullable=False, primary_key=True)
     asset_id = Column(ForeignKey("asset.id"), nullable=False, primary_key=True)
-    rsi = Column(Integer)
-    macd = Column(Integer)
-    macdh = Column(Integer)
-    macds = Column(Integer)
-    adx = Column(Integer)
-    adx_dmp = Column(Integer)
-    adx_dmn = Column(Integer)
-    sma_200 = Column(Integer)
+    rsi = Column(Float)
+    macd = Column(Float)
+    macdh = Column(Float)
+    macds = Column(Float)
+    adx = Column(Float)
+    adx_dmp = Column(Float)
+    adx_dmn = Column(Float)
+    sma_200 = Column(Float)
+
+class IndicatorValue(Base):
+    __tablename__ = "indicator_value"
+
+    # Long format: one row per series per bar, `name` from indicators.registry.series_name
+    asset_id = Column(ForeignKey("asset.id"), nullable=False, primary_key=True)
+    timeframe = Column(String, nullable=False, primary_key=True)
+    name = Column(String, nullable=False, primary_key=True)
+    datetime = Column(DateTime, nullable=False, primary_key=True)
+    value = Column(Float, nullable=False)
 
 class Strategy(Base):
     __tablename__ = "strategy"
@@ -82,4 +138,32 @@ class ETFHolding(Base):
     dt =  Column(Date, primary_key=True)
     shares = Column(Integer)
     weight = Column(Integer)
-    name = Column(String, nullable=False)
\ No newline at end of file
+    name = Column(String, nullable=False)
+
+class BackfillJob(Base):
+    __tablename__ = "backfill_job"
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)
+    timeframe = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="pending")
+    total_batches = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime)
+
+    batches = relationship("BackfillBatch", back_populates="job")
+
+class BackfillBatch(Base):
+    __tablename__ = "backfill_batch"
+
+    job_id = Column(ForeignKey("backfill_job.id"), nullable=False, primary_key=True)
+    batch_no = Column(Integer, nullable=False, primary_key=True)
+    symbols = Column(ARRAY(String), nullable=False)
+    start = Column(DateTime, nullable=False)
+    end = Column(DateTime, nullable=False)
+    status = Column(String, nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    bars = Column(Integer)
+    error = Column(String)
+
+    job = relationship("BackfillJob", back_populates="batches")
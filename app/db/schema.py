@@ -0,0 +1,121 @@
+import os
+from sqlalchemy import text
+from db.models import Base
+from db.timeframes import create_aggregates
+from indicators.streaming import INDICATOR_COLUMNS
+
+# Time-series tables managed as hypertables. Tables that do not exist yet
+# (a tick table, say) are skipped, so adding one here ahead of its model is safe.
+#   chunk:     chunk_time_interval; about a day of minute bars keeps recent
+#              chunks and their indexes in memory
+#   segmentby: compressed rows are grouped per asset so per-symbol range
+#              scans only decompress that symbol's segments
+#   compress:  chunks older than this are compressed
+#   retain:    chunks older than this are dropped, None keeps everything
+HYPERTABLES = [
+    {
+        "table": "asset_price",
+        "time_column": "datetime",
+        "chunk": "1 day",
+        "segmentby": "asset_id",
+        "orderby": "datetime DESC",
+        "compress": "7 days",
+        "retain": os.environ.get("ASSET_PRICE_RETENTION", "5 years"),
+    },
+    {
+        "table": "asset_bar",
+        "time_column": "datetime",
+        "chunk": "7 days",
+        "segmentby": "asset_id, timeframe",
+        "orderby": "datetime DESC",
+        "compress": "30 days",
+        "retain": os.environ.get("ASSET_PRICE_RETENTION", "5 years"),
+    },
+    {
+        "table": "indicator_value",
+        "time_column": "datetime",
+        "chunk": "7 days",
+        "segmentby": "asset_id, timeframe, name",
+        "orderby": "datetime DESC",
+        "compress": "14 days",
+        "retain": None,
+    },
+    {
+        "table": "tick",
+        "time_column": "datetime",
+        "chunk": "1 hour",
+        "segmentby": "asset_id",
+        "orderby": "datetime DESC",
+        "compress": "1 day",
+        "retain": os.environ.get("TICK_RETENTION", "90 days"),
+    },
+]
+
+async def _table_exists(conn, table):
+    result = await conn.execute(text("SELECT to_regclass(:table) IS NOT NULL"), {"table": table})
+    return result.scalar()
+
+async def create_hypertable(conn, config):
+    table = config["table"]
+
+    # migrate_data moves rows already in a plain table into chunks. On a large
+    # table this locks it for a while, so it only happens on the first run.
+    await conn.execute(text(
+        f"SELECT create_hypertable('{table}', by_range('{config['time_column']}', INTERVAL '{config['chunk']}'), "
+        f"if_not_exists => TRUE, migrate_data => TRUE)"
+    ))
+    # Only applies to chunks created from now on
+    await conn.execute(text(
+        f"SELECT set_chunk_time_interval('{table}', INTERVAL '{config['chunk']}')"
+    ))
+
+    if config.get("compress"):
+        # Settings cannot be changed once chunks are compressed, so they are
+        # only applied the first time
+        result = await conn.execute(text(
+            "SELECT compression_enabled FROM timescaledb_information.hypertables "
+            "WHERE hypertable_name = :table"
+        ), {"table": table})
+        if not result.scalar():
+            await conn.execute(text(
+                f"ALTER TABLE {table} SET ("
+                f"timescaledb.compress, "
+                f"timescaledb.compress_segmentby = '{config['segmentby']}', "
+                f"timescaledb.compress_orderby = '{config['orderby']}')"
+            ))
+        await conn.execute(text(
+            f"SELECT add_compression_policy('{table}', INTERVAL '{config['compress']}', if_not_exists => TRUE)"
+        ))
+
+    # Drop any previous policy so a changed retention setting takes effect
+    await conn.execute(text(f"SELECT remove_retention_policy('{table}', if_exists => TRUE)"))
+    if config.get("retain"):
+        await conn.execute(text(
+            f"SELECT add_retention_policy('{table}', INTERVAL '{config['retain']}', if_not_exists => TRUE)"
+        ))
+
+async def bootstrap(conn):
+    """
+    Create tables and apply the TimescaleDB setup. Every step is idempotent,
+    so this runs on each startup.
+    """
+    await conn.execute(text("CREATE EXTENSION IF NOT EXISTS timescaledb"))
+    await conn.run_sync(Base.metadata.create_all)
+
+    # create_all does not add indexes to tables that already exist
+    await conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_asset_symbol ON asset (symbol)"))
+
+    # indicator columns started out as integer, which truncated every value
+    result = await conn.execute(text(
+        "SELECT column_name FROM information_schema.columns "
+        "WHERE table_name = 'indicator' AND data_type = 'integer' AND column_name = ANY(:columns)"
+    ), {"columns": list(INDICATOR_COLUMNS)})
+    for column in result.scalars().all():
+        await conn.execute(text(f"ALTER TABLE indicator ALTER COLUMN {column} TYPE double precision"))
+
+    for config in HYPERTABLES:
+        if await _table_exists(conn, config["table"]):
+            await create_hypertable(conn, config)
+
+    # Needs asset_price to be a hypertable first
+    await create_aggregates(conn)
@@ -0,0 +1,218 @@
+import re
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from db.database import engine
+
+# Continuous aggregates rolled up from asset_price, each built on the one
+# before it so a refresh only re-reads the finer aggregate, not raw minutes.
+#   minutes:  bucket width
+#   source:   table or aggregate it is rolled up from
+#   refresh:  (start_offset, end_offset, schedule) for the refresh policy.
+#             start_offset covers late stream and gap-fill writes; anything
+#             newer than end_offset is computed from the source at query time
+#             (real-time aggregation). Older history is only materialized by
+#             refresh_aggregates(), which loaders call over what they wrote.
+AGGREGATES = [
+    {"view": "asset_price_5m", "minutes": 5, "source": "asset_price",
+     "refresh": ("10 days", "5 minutes", "5 minutes")},
+    {"view": "asset_price_15m", "minutes": 15, "source": "asset_price_5m",
+     "refresh": ("10 days", "15 minutes", "15 minutes")},
+    {"view": "asset_price_1h", "minutes": 60, "source": "asset_price_15m",
+     "refresh": ("10 days", "1 hour", "1 hour")},
+    {"view": "asset_price_1d", "minutes": 1440, "source": "asset_price_1h",
+     "refresh": ("10 days", "1 day", "1 hour")},
+]
+
+# Tables that can be read, finest first
+SOURCES = [("asset_price", 1)] + [(aggregate["view"], aggregate["minutes"]) for aggregate in AGGREGATES]
+
+UNITS = {"m": 1, "min": 1, "h": 60, "d": 1440, "w": 10080}
+
+# Hourly bars the historical loader keeps in asset_bar (TimeFrame.value; the
+# default of populate_prices and price backfills). Every timeframe of an hour
+# or more is re-bucketed from them, but only for assets with no minute bars
+# at all (never streamed or gap-filled), so the two never mix in one series.
+LOADER_TIMEFRAME = "1Hour"
+LOADER_MINUTES = 60
+
+MINUTE_ASSETS = text("""
+    SELECT id FROM unnest(CAST(:asset_ids AS integer[])) AS id
+    WHERE EXISTS (SELECT 1 FROM asset_price WHERE asset_id = id)
+""")
+
+async def create_aggregates(conn):
+    """Create the continuous aggregates and their refresh policies if missing."""
+    for aggregate in AGGREGATES:
+        view = aggregate["view"]
+        start_offset, end_offset, schedule = aggregate["refresh"]
+
+        # WITH NO DATA so this can run inside a transaction; refresh_aggregates()
+        # fills it afterwards
+        await conn.execute(text(f"""
+            CREATE MATERIALIZED VIEW IF NOT EXISTS {view}
+            WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+            SELECT time_bucket(INTERVAL '{aggregate["minutes"]} minutes', datetime) AS datetime,
+                   asset_id,
+                   first(open, datetime) AS open,
+                   max(high) AS high,
+                   min(low) AS low,
+                   last(close, datetime) AS close,
+                   sum(volume) AS volume
+            FROM {aggregate["source"]}
+            GROUP BY 1, asset_id
+            WITH NO DATA
+        """))
+        await conn.execute(text(f"""
+            SELECT add_continuous_aggregate_policy('{view}',
+                start_offset => INTERVAL '{start_offset}',
+                end_offset => INTERVAL '{end_offset}',
+                schedule_interval => INTERVAL '{schedule}',
+                if_not_exists => TRUE)
+        """))
+
+# time_bucket's default origin for timestamps; buckets up to a day start at midnight
+BUCKET_ORIGIN = datetime(2000, 1, 3)
+
+def _bucket_bounds(start, end, minutes):
+    # Widen [start, end) out to whole buckets; a refresh window that does not
+    # cover a full bucket is rejected
+    width = timedelta(minutes=minutes)
+    lo = None if start is None else BUCKET_ORIGIN + (start - BUCKET_ORIGIN) // width * width
+    hi = None if end is None else BUCKET_ORIGIN - (BUCKET_ORIGIN - end) // width * width
+    return lo, hi
+
+def _timestamp(value):
+    return f"TIMESTAMP '{value.isoformat(sep=' ')}'" if value is not None else "NULL::timestamp"
+
+async def refresh_aggregates(start=None, end=None):
+    """
+    Materialize [start, end) of asset_price into every aggregate, finest
+    first so each one reads a refreshed source. None leaves that side open.
+
+    Policies only cover the last few days, so anything loaded further back
+    (the first bootstrap of an existing table, backfills) must come through
+    here or it never reaches the aggregates. Only invalidated buckets are
+    recomputed, so an open-ended call is cheap once the views are filled.
+    """
+    # CALL refresh_continuous_aggregate cannot run inside a transaction block
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        for aggregate in AGGREGATES:
+            lo, hi = _bucket_bounds(start, end, aggregate["minutes"])
+            await conn.execute(text(
+                f"CALL refresh_continuous_aggregate('{aggregate['view']}', {_timestamp(lo)}, {_timestamp(hi)})"
+            ))
+
+def parse_timeframe(timeframe):
+    """'15m', '4h', '1d', '1w' → minutes. Raises ValueError on anything else."""
+    match = re.fullmatch(r"(\d+)\s*(m|min|h|d|w)", timeframe.strip().lower())
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"Unknown timeframe: {timeframe!r}")
+    return int(match.group(1)) * UNITS[match.group(2)]
+
+def pick_source(minutes):
+    """The coarsest table whose bucket evenly divides `minutes`."""
+    return max(
+        ((table, width) for table, width in SOURCES if minutes % width == 0),
+        key=lambda source: source[1]
+    )
+
+def loader_source(minutes):
+    """(asset_bar timeframe, its minutes) when `minutes` can be built from loader bars, else None."""
+    return (LOADER_TIMEFRAME, LOADER_MINUTES) if minutes % LOADER_MINUTES == 0 else None
+
+async def minute_assets(session, asset_ids):
+    """The subset of `asset_ids` with any rows in asset_price."""
+    result = await session.execute(MINUTE_ASSETS, {"asset_ids": list(asset_ids)})
+    return set(result.scalars().all())
+
+def _bars_query(timeframe, filters, params, group=(), loader=False):
+    # SELECT for `timeframe` bars from the coarsest usable source, asset_bar
+    # with `loader`. `group` names extra columns that are selected and
+    # grouped on when re-bucketing.
+    minutes = parse_timeframe(timeframe)
+    if loader:
+        params["loader_timeframe"], width = loader_source(minutes)
+        table = "asset_bar"
+        filters = filters + ["timeframe = :loader_timeframe"]
+    else:
+        table, width = pick_source(minutes)
+    where = " AND ".join(filters)
+    extra = "".join(f"{column}, " for column in group)
+
+    if width == minutes:
+        return f"SELECT {extra}datetime, open, high, low, close, volume FROM {table} WHERE {where}"
+
+    params["bucket"] = timedelta(minutes=minutes)
+    group_by = ", ".join(("1",) + tuple(group))
+    return f"""
+        SELECT time_bucket(:bucket, datetime) AS datetime, {extra}
+               first(open, datetime) AS open,
+               max(high) AS high,
+               min(low) AS low,
+               last(close, datetime) AS close,
+               sum(volume) AS volume
+        FROM {table}
+        WHERE {where}
+        GROUP BY {group_by}
+    """
+
+def _range_filters(filters, params, start, end):
+    if start is not None:
+        filters.append("datetime >= :start")
+        params["start"] = start
+    if end is not None:
+        filters.append("datetime < :end")
+        params["end"] = end
+
+async def get_bars(session, asset_id, timeframe="1m", start=None, end=None, limit=None, descending=False):
+    """
+    OHLCV bars for one asset at any timeframe in [start, end).
+
+    Reads the coarsest aggregate the timeframe can be built from and only
+    re-buckets when it is not an exact match, e.g. 30m comes from the 15m
+    aggregate and 1w from the daily one. Datetimes are naive US/Eastern like
+    asset_price, so daily bars include extended hours. An asset with no
+    minute bars is read from the loader's asset_bar instead, for timeframes
+    those bars can build.
+    """
+    loader = loader_source(parse_timeframe(timeframe)) is not None and not await minute_assets(session, [asset_id])
+
+    params = {"asset_id": asset_id}
+    filters = ["asset_id = :asset_id"]
+    _range_filters(filters, params, start, end)
+    query = _bars_query(timeframe, filters, params, loader=loader)
+
+    query += " ORDER BY datetime DESC" if descending else " ORDER BY datetime"
+    if limit is not None:
+        query += " LIMIT :limit"
+        params["limit"] = limit
+
+    result = await session.execute(text(query), params)
+    return result.all()
+
+async def get_bars_many(session, asset_ids, timeframe="1m", start=None, end=None):
+    """get_bars() for several assets in one query, ordered by asset_id then datetime, with asset_id first."""
+    asset_ids = list(asset_ids)
+    loader_ids = []
+    if loader_source(parse_timeframe(timeframe)) is not None:
+        streamed = await minute_assets(session, asset_ids)
+        loader_ids = [asset_id for asset_id in asset_ids if asset_id not in streamed]
+        asset_ids = [asset_id for asset_id in asset_ids if asset_id in streamed]
+
+    params = {}
+    parts = []
+    for key, ids, loader in (("asset_ids", asset_ids, False), ("loader_ids", loader_ids, True)):
+        if not ids:
+            continue
+        params[key] = ids
+        filters = [f"asset_id = ANY(:{key})"]
+        _range_filters(filters, params, start, end)
+        query = _bars_query(timeframe, filters, params, group=("asset_id",), loader=loader)
+        # Same column order from either query shape
+        parts.append(f"SELECT asset_id, datetime, open, high, low, close, volume FROM ({query}) {key}")
+
+    if not parts:
+        return []
+    result = await session.execute(text(" UNION ALL ".join(parts) + " ORDER BY asset_id, datetime"), params)
+    return result.all()
@@ -0,0 +1,295 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import time
+import numpy as np
+import pandas as pd
+from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.models import Asset
+from db.database import async_session_maker
+from db.bulk import copy_upsert
+from db.timeframes import LOADER_TIMEFRAME, get_bars_many, minute_assets
+from indicators.streaming import (
+    RSI_PERIOD, MACD_FAST, MACD_SLOW, MACD_SIGNAL, ADX_PERIOD, SMA_PERIOD, INDICATOR_COLUMNS, DEFAULT_WARMUP,
+)
+from indicators.registry import evaluate, flatten, node_key
+
+# Full rebuild of the indicator tables. Values come from indicators.registry
+# and match indicators.streaming bar for bar: the same SMA-seeded EMA / Wilder
+# recurrences, run over whole arrays with lfilter instead of one bar at a time.
+
+# Minute bars, or the loader's hourly bars for assets that have none.
+# Run through COPY on the raw asyncpg connection, hence $n placeholders.
+PRICES = """
+    SELECT asset_id, datetime, high, low, close FROM (
+        SELECT asset_id, datetime, high, low, close FROM asset_price
+        WHERE asset_id = ANY($1::integer[])
+        UNION ALL
+        SELECT asset_id, datetime, high, low, close FROM asset_bar
+        WHERE asset_id = ANY($2::integer[]) AND timeframe = $3
+    ) bars
+    ORDER BY asset_id, datetime
+"""
+
+# The same, limited to bars from $4 on plus the $5 bars before it per asset.
+# Each LATERAL walks the (asset_id, datetime) key backwards from $4, so a
+# partial rebuild reads a fixed warm-up instead of the whole history.
+PRICES_SINCE = """
+    SELECT asset_id, datetime, high, low, close FROM (
+        SELECT a.asset_id, w.datetime, w.high, w.low, w.close
+        FROM unnest($1::integer[]) AS a(asset_id)
+        CROSS JOIN LATERAL (
+            SELECT datetime, high, low, close FROM asset_price
+            WHERE asset_id = a.asset_id AND datetime < $4
+            ORDER BY datetime DESC
+            LIMIT $5
+        ) w
+        UNION ALL
+        SELECT asset_id, datetime, high, low, close FROM asset_price
+        WHERE asset_id = ANY($1::integer[]) AND datetime >= $4
+        UNION ALL
+        SELECT a.asset_id, w.datetime, w.high, w.low, w.close
+        FROM unnest($2::integer[]) AS a(asset_id)
+        CROSS JOIN LATERAL (
+            SELECT datetime, high, low, close FROM asset_bar
+            WHERE asset_id = a.asset_id AND timeframe = $3 AND datetime < $4
+            ORDER BY datetime DESC
+            LIMIT $5
+        ) w
+        UNION ALL
+        SELECT asset_id, datetime, high, low, close FROM asset_bar
+        WHERE asset_id = ANY($2::integer[]) AND timeframe = $3 AND datetime >= $4
+    ) bars
+    ORDER BY asset_id, datetime
+"""
+
+INDICATOR_TABLE_COLUMNS = ("datetime", "asset_id") + INDICATOR_COLUMNS
+
+# Wide indicator table columns → (registry request, output)
+WIDE_COLUMNS = {
+    "rsi": (("rsi", {"period": RSI_PERIOD}), None),
+    "macd": (("macd", {"fast": MACD_FAST, "slow": MACD_SLOW, "signal": MACD_SIGNAL}), "macd"),
+    "macdh": (("macd", {"fast": MACD_FAST, "slow": MACD_SLOW, "signal": MACD_SIGNAL}), "hist"),
+    "macds": (("macd", {"fast": MACD_FAST, "slow": MACD_SLOW, "signal": MACD_SIGNAL}), "signal"),
+    "adx": (("adx", {"period": ADX_PERIOD}), "adx"),
+    "adx_dmp": (("adx", {"period": ADX_PERIOD}), "plus"),
+    "adx_dmn": (("adx", {"period": ADX_PERIOD}), "minus"),
+    "sma_200": (("sma", {"period": SMA_PERIOD}), None),
+}
+
+def compute(high, low, close):
+    """Indicator table columns for one asset's bars, in time order."""
+    requests = [request for request, _ in WIDE_COLUMNS.values()]
+    results = evaluate({"high": high, "low": low, "close": close}, requests)
+
+    values = {}
+    for column, ((name, params), output) in WIDE_COLUMNS.items():
+        result = results[node_key(name, params)]
+        values[column] = result[output] if output else result
+    return values
+
+def _groups(asset_ids):
+    # Start and end offsets of each asset's run in asset_id-ordered arrays
+    bounds = np.flatnonzero(np.diff(asset_ids)) + 1
+    starts = np.concatenate(([0], bounds))
+    ends = np.concatenate((bounds, [len(asset_ids)]))
+    return zip(starts, ends)
+
+def compute_grouped(asset_ids, high, low, close):
+    """compute() over every asset in asset_id-ordered arrays, into full-length output arrays."""
+    out = {column: np.full(len(close), np.nan) for column in INDICATOR_COLUMNS}
+    for start, end in _groups(asset_ids):
+        values = compute(high[start:end], low[start:end], close[start:end])
+        for column in INDICATOR_COLUMNS:
+            out[column][start:end] = values[column]
+    return out
+
+def _records(datetimes, asset_ids, values, keep):
+    # NaN becomes NULL; tolist() hands asyncpg plain Python values
+    columns = [datetimes[keep].tolist(), asset_ids[keep].tolist()]
+    for column in INDICATOR_COLUMNS:
+        array = values[column][keep]
+        columns.append([None if v != v else v for v in array.tolist()])
+    return list(zip(*columns))
+
+async def load_prices(session, asset_ids, since=None, warmup=DEFAULT_WARMUP):
+    """
+    (asset_ids, datetimes, high, low, close) arrays for `asset_ids`, ordered
+    by asset then time, or None without bars. With `since` only bars from
+    `since` on and the `warmup` bars before it are read.
+
+    Rows come out with COPY and are parsed column-wise by pandas, so a chunk
+    never exists as Python row tuples.
+    """
+    streamed = await minute_assets(session, asset_ids)
+    loader_ids = [asset_id for asset_id in asset_ids if asset_id not in streamed]
+
+    buffer = io.BytesIO()
+    connection = await session.connection()
+    raw = await connection.get_raw_connection()
+    if since is None:
+        await raw.driver_connection.copy_from_query(
+            PRICES, list(asset_ids), loader_ids, LOADER_TIMEFRAME, output=buffer, format="csv"
+        )
+    else:
+        minute_ids = [asset_id for asset_id in asset_ids if asset_id in streamed]
+        await raw.driver_connection.copy_from_query(
+            PRICES_SINCE, minute_ids, loader_ids, LOADER_TIMEFRAME, since, warmup, output=buffer, format="csv"
+        )
+    if not buffer.tell():
+        return None
+
+    buffer.seek(0)
+    frame = pd.read_csv(
+        buffer, header=None, names=["asset_id", "datetime", "high", "low", "close"],
+        dtype={"asset_id": np.int64, "high": np.float64, "low": np.float64, "close": np.float64},
+    )
+    return (
+        frame["asset_id"].to_numpy(),
+        pd.to_datetime(frame["datetime"], format="ISO8601").to_numpy(dtype="datetime64[us]"),
+        frame["high"].to_numpy(),
+        frame["low"].to_numpy(),
+        frame["close"].to_numpy(),
+    )
+
+async def rebuild_indicators(db: AsyncSession, asset_ids=None, chunk_size=50, since=None, workers=1):
+    """
+    Recompute indicators for `asset_ids` (default every S&P 500 asset) from
+    their full price history and upsert them with COPY.
+
+    Prices are read `chunk_size` assets per ordered query. With `since`, only
+    rows from `since` on are written, and only the DEFAULT_WARMUP bars before
+    it are read to warm the recurrences up, the same allowance the streaming
+    engine seeds from. With `workers` > 1 each chunk is computed on a process pool
+    (indicators.parallel); raise `chunk_size` with it so every worker has
+    symbols to take and each chunk still ends in one bulk write.
+    """
+    if asset_ids is None:
+        result = await db.scalars(select(Asset.id).where(Asset.is_sp500 == True).order_by(Asset.id))
+        asset_ids = result.all()
+
+    print(f"--- Rebuilding indicators for {len(asset_ids)} assets ---")
+    started = time.perf_counter()
+    written = 0
+
+    with contextlib.ExitStack() as stack:
+        compute_chunk = compute_grouped
+        if workers > 1:
+            from indicators.parallel import ParallelComputer
+            compute_chunk = stack.enter_context(ParallelComputer(workers)).compute_grouped
+
+        for i in range(0, len(asset_ids), chunk_size):
+            written += await _rebuild_chunk(db, asset_ids[i:i + chunk_size], since, compute_chunk)
+            print(f"Indicators for assets {i + 1}-{min(i + chunk_size, len(asset_ids))} written")
+
+    print(f"--- Indicator rebuild finished: {written} rows in {time.perf_counter() - started:.1f}s ---")
+    return written
+
+async def _rebuild_chunk(db, chunk, since, compute_chunk):
+    prices = await load_prices(db, chunk, since)
+    if prices is None:
+        return 0
+    ids, datetimes, high, low, close = prices
+
+    values = await asyncio.to_thread(compute_chunk, ids, high, low, close)
+    keep = np.ones(len(ids), dtype=bool) if since is None else datetimes >= np.datetime64(since, "us")
+
+    records = _records(datetimes, ids, values, keep)
+    written = await copy_upsert(db, "indicator", INDICATOR_TABLE_COLUMNS, records, ("datetime", "asset_id"))
+    await db.commit()
+    return written
+
+VALUE_COLUMNS = ("asset_id", "timeframe", "name", "datetime", "value")
+
+# Series kept in indicator_value, written by the nightly task and the CLI
+STORED_INDICATORS = [
+    ("rsi", {}),
+    ("macd", {}),
+    ("adx", {}),
+    ("atr", {}),
+    ("bbands", {}),
+    ("ema", {"period": 20}),
+    ("sma", {"period": 50}),
+    ("sma", {"period": SMA_PERIOD}),
+]
+VALUE_TIMEFRAMES = ("1d",)
+
+def _value_records(asset_id, timeframe, datetimes, series, keep):
+    # Long format stores only defined values; warm-up NaNs are left out
+    records = []
+    for name, values in series.items():
+        mask = keep & ~np.isnan(values)
+        count = int(mask.sum())
+        records.extend(zip([asset_id] * count, [timeframe] * count, [name] * count,
+                           datetimes[mask].tolist(), values[mask].tolist()))
+    return records
+
+async def rebuild_indicator_values(db: AsyncSession, requests, asset_ids=None, timeframe="1d", chunk_size=50, since=None):
+    """
+    Compute registry indicators (`requests` as (name, params) pairs) for
+    `asset_ids` at `timeframe` and upsert them into indicator_value.
+
+    All requests are planned together, so intermediates they share are
+    computed once per symbol.
+    """
+    if asset_ids is None:
+        result = await db.scalars(select(Asset.id).where(Asset.is_sp500 == True).order_by(Asset.id))
+        asset_ids = result.all()
+
+    print(f"--- Computing {len(requests)} indicators at {timeframe} for {len(asset_ids)} assets ---")
+    started = time.perf_counter()
+    written = 0
+
+    for i in range(0, len(asset_ids), chunk_size):
+        rows = await get_bars_many(db, asset_ids[i:i + chunk_size], timeframe)
+        if not rows:
+            continue
+        ids, datetimes, *columns = zip(*rows)
+        ids = np.array(ids, dtype=np.int64)
+        datetimes = np.array(datetimes, dtype="datetime64[us]")
+        bars = {name: np.array(values, dtype=np.float64) for name, values in zip(("open", "high", "low", "close", "volume"), columns)}
+        keep = np.ones(len(ids), dtype=bool) if since is None else datetimes >= np.datetime64(since, "us")
+
+        def compute_chunk():
+            records = []
+            for start, end in _groups(ids):
+                group = {name: values[start:end] for name, values in bars.items()}
+                series = flatten(evaluate(group, requests))
+                records.extend(_value_records(int(ids[start]), timeframe, datetimes[start:end], series, keep[start:end]))
+            return records
+
+        records = await asyncio.to_thread(compute_chunk)
+        written += await copy_upsert(db, "indicator_value", VALUE_COLUMNS, records, ("asset_id", "timeframe", "name", "datetime"))
+        await db.commit()
+
+    print(f"--- Indicator values finished: {written} rows in {time.perf_counter() - started:.1f}s ---")
+    return written
+
+async def main(symbols, workers=1, chunk_size=50, value_timeframes=VALUE_TIMEFRAMES):
+    async with async_session_maker() as db:
+        asset_ids = None
+        if symbols:
+            result = await db.scalars(select(Asset.id).where(Asset.symbol.in_(symbols)).order_by(Asset.id))
+            asset_ids = result.all()
+        await rebuild_indicators(db, asset_ids, chunk_size=chunk_size, workers=workers)
+        for timeframe in value_timeframes:
+            await rebuild_indicator_values(db, STORED_INDICATORS, asset_ids, timeframe)
+
+def parse_args(workers=1, chunk_size=50):
+    parser = argparse.ArgumentParser(description="Rebuild the indicator and indicator_value tables from asset_price")
+    parser.add_argument("symbols", nargs="*", help="defaults to the S&P 500")
+    parser.add_argument("--workers", type=int, default=workers, help="processes to compute on")
+    parser.add_argument("--chunk-size", type=int, default=chunk_size, help="assets per query and bulk write")
+    parser.add_argument("--values", action="append", metavar="TIMEFRAME",
+                        help=f"timeframe to write STORED_INDICATORS at, repeatable (default {' '.join(VALUE_TIMEFRAMES)}); 'none' skips them")
+    args = parser.parse_args()
+    if args.values is None:
+        args.values = list(VALUE_TIMEFRAMES)
+    args.values = [timeframe for timeframe in args.values if timeframe != "none"]
+    return args
+
+if __name__ == "__main__":
+    args = parse_args()
+    asyncio.run(main(args.symbols, args.workers, args.chunk_size, args.values))
@@ -0,0 +1,127 @@
+import asyncio
+import json
+import math
+from zoneinfo import ZoneInfo
+import numpy as np
+from sqlalchemy import text
+from config import redis_client
+from db.adjustments import adjustments
+from db.timeframes import get_bars, parse_timeframe
+from indicators.registry import REGISTRY, SOURCES, evaluate, node_key, series_name
+
+EASTERN = ZoneInfo("America/New_York")
+
+# Bars fetched ahead of the requested range so EMA/Wilder values have settled
+# by its first bar, the same allowance the streaming engine warms up with
+WARMUP_BARS = 1000
+
+# Keys embed the newest stored bar, so they go stale on their own when a bar
+# lands; the TTL only bounds how long unused series stay in Redis
+CACHE_TTL = 6 * 60 * 60
+
+LAST_BAR = text("""
+    SELECT greatest(
+        (SELECT max(datetime) FROM asset_price
+         WHERE asset_id = :asset_id AND (CAST(:end AS timestamp) IS NULL OR datetime < :end)),
+        (SELECT max(datetime) FROM asset_bar
+         WHERE asset_id = :asset_id AND (CAST(:end AS timestamp) IS NULL OR datetime < :end))
+    )
+""")
+
+def parse_params(name, raw):
+    """Coerce query-string params to the types of the indicator's defaults."""
+    if name not in REGISTRY or name in SOURCES:
+        raise KeyError(f"Unknown indicator: {name}")
+    defaults = REGISTRY[name].defaults
+    params = {}
+    for key, value in raw.items():
+        if key not in defaults:
+            raise ValueError(f"{name} does not take {key}")
+        params[key] = type(defaults[key])(value)
+        # Every numeric param (period, fast, slow, signal, std) is a length or
+        # a multiplier; zero or less divides by zero or breaks the windows
+        if isinstance(params[key], (int, float)) and not (math.isfinite(params[key]) and params[key] > 0):
+            raise ValueError(f"{key} must be positive")
+    if "source" in params and params["source"] not in SOURCES:
+        raise ValueError(f"source must be one of {', '.join(SOURCES)}")
+    return params
+
+def naive_eastern(value):
+    """asset_price datetimes are naive US/Eastern; aware values are converted, naive ones taken as Eastern."""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(EASTERN).replace(tzinfo=None)
+
+def cache_key(asset_id, timeframe, key, start, end, limit, last_bar, actions):
+    return ":".join([
+        "indicator", str(asset_id), timeframe, series_name(key),
+        start.isoformat() if start else "", end.isoformat() if end else "",
+        str(limit), last_bar.isoformat() if last_bar else "none", actions,
+    ])
+
+async def _load_bars(session, asset_id, timeframe, start, end, limit):
+    # Warm-up history before the range, then the range itself
+    if start is None:
+        rows = await get_bars(session, asset_id, timeframe, end=end, limit=limit + WARMUP_BARS, descending=True)
+        return rows[::-1], max(0, len(rows) - limit)
+
+    before = await get_bars(session, asset_id, timeframe, end=start, limit=WARMUP_BARS, descending=True)
+    rows = await get_bars(session, asset_id, timeframe, start=start, end=end)
+    return before[::-1] + rows, len(before)
+
+def _compute(rows, skip, name, params, factors=None):
+    columns = list(zip(*rows)) if rows else [()] * 6
+    bars = {column: np.array(values, dtype=np.float64) for column, values in zip(SOURCES, columns[1:])}
+    if factors is not None:
+        bars = factors.adjust({"datetime": columns[0], **bars})
+    key = node_key(name, params)
+    result = evaluate(bars, [(name, params)])[key]
+    outputs = result if isinstance(result, dict) else {name: result}
+
+    return {
+        "datetime": [dt.isoformat() for dt in columns[0][skip:]],
+        "series": {
+            output: [None if np.isnan(value) else value for value in values[skip:].tolist()]
+            for output, values in outputs.items()
+        },
+    }
+
+async def get_indicator(session, asset_id, name, params=None, timeframe="1d", start=None, end=None, limit=500, adjusted=True):
+    """
+    One indicator series for an asset, memoized in Redis.
+
+    Covers [start, end) at `timeframe`, or the last `limit` bars when no start
+    is given; naive `start`/`end` are US/Eastern. A miss loads the bars plus
+    WARMUP_BARS of history, computes through indicators.registry and stores
+    the result. Bars are split- and dividend-adjusted unless `adjusted` is
+    false; keys carry the corporate actions version so they go stale with it.
+    """
+    parse_timeframe(timeframe)
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    params = params or {}
+    key = node_key(name, params)
+    start, end = naive_eastern(start), naive_eastern(end)
+
+    result = await session.execute(LAST_BAR, {"asset_id": asset_id, "end": end})
+    last_bar = result.scalar()
+    factors = await adjustments.get(asset_id) if adjusted else None
+    actions = f"adj{int(adjustments.version or 0)}" if adjusted else "raw"
+    redis_key = cache_key(asset_id, timeframe, key, start, end, limit, last_bar, actions)
+
+    cached = await redis_client.get(redis_key)
+    if cached:
+        return json.loads(cached)
+
+    rows, skip = await _load_bars(session, asset_id, timeframe, start, end, limit)
+    payload = await asyncio.to_thread(_compute, rows, skip, name, params, factors)
+    payload.update({
+        "indicator": series_name(key),
+        "timeframe": timeframe,
+        "adjusted": adjusted,
+        "params": dict(key[1]),
+        "last_bar": last_bar.isoformat() if last_bar else None,
+    })
+
+    await redis_client.setex(redis_key, CACHE_TTL, json.dumps(payload))
+    return payload
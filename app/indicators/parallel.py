@@ -0,0 +1,101 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from indicators.batch import compute, _groups
+from indicators.streaming import INDICATOR_COLUMNS
+
+# Prices and results are exchanged through memory-mapped files in a RAM-backed
+# directory: the parent writes the inputs once, each worker maps them and
+# writes its symbols' results straight into a shared output array, and only
+# file paths and offsets cross the process boundary.
+SHM_ROOT = os.environ.get("INDICATOR_SHM_DIR", "/dev/shm")
+
+# Writing through a mapping onto a full tmpfs kills the process with SIGBUS
+# instead of raising, so a chunk only goes to SHM_ROOT with this much to spare
+SHM_HEADROOM = 64 * 1024 * 1024
+
+INPUTS = {"high": np.float64, "low": np.float64, "close": np.float64}
+
+def _map(directory, name, dtype, shape, mode):
+    return np.memmap(os.path.join(directory, f"{name}.bin"), dtype=dtype, mode=mode, shape=shape)
+
+def _workdir(nbytes):
+    # SHM_ROOT when it has room for the chunk, otherwise the disk-backed temp dir
+    if os.path.isdir(SHM_ROOT) and shutil.disk_usage(SHM_ROOT).free >= nbytes + SHM_HEADROOM:
+        return tempfile.mkdtemp(prefix="indicators-", dir=SHM_ROOT)
+    print(f"Not enough space in {SHM_ROOT} for {nbytes // 2**20} MB of indicator inputs, using {tempfile.gettempdir()}")
+    return tempfile.mkdtemp(prefix="indicators-")
+
+def _compute_ranges(directory, n, ranges):
+    # Runs in a worker process
+    inputs = {name: _map(directory, name, dtype, (n,), "r") for name, dtype in INPUTS.items()}
+    out = _map(directory, "out", np.float64, (len(INDICATOR_COLUMNS), n), "r+")
+
+    for start, end in ranges:
+        values = compute(inputs["high"][start:end], inputs["low"][start:end], inputs["close"][start:end])
+        for k, column in enumerate(INDICATOR_COLUMNS):
+            out[k, start:end] = values[column]
+
+    out.flush()
+    return sum(end - start for start, end in ranges)
+
+def _partition(ranges, parts):
+    # Contiguous runs of symbols with roughly equal row counts
+    total = sum(end - start for start, end in ranges)
+    target = max(1, total // parts)
+    tasks, current, size = [], [], 0
+    for start, end in ranges:
+        current.append((start, end))
+        size += end - start
+        if size >= target:
+            tasks.append(current)
+            current, size = [], 0
+    if current:
+        tasks.append(current)
+    return tasks
+
+class ParallelComputer:
+    """
+    compute_grouped() spread over a process pool.
+
+    Use as a context manager so the pool is started once per rebuild and
+    shut down afterwards. Each call splits the symbols into about four tasks
+    per worker so one long history does not leave the other cores idle.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count()
+        self.pool = None
+
+    def __enter__(self):
+        # spawn rather than fork: the parent has an event loop and worker threads running
+        self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self
+
+    def __exit__(self, *exc):
+        self.pool.shutdown()
+        self.pool = None
+
+    def compute_grouped(self, asset_ids, high, low, close):
+        n = len(close)
+        nbytes = n * np.dtype(np.float64).itemsize * (len(INPUTS) + len(INDICATOR_COLUMNS))
+        directory = _workdir(nbytes)
+        try:
+            for name, array in (("high", high), ("low", low), ("close", close)):
+                _map(directory, name, INPUTS[name], (n,), "w+")[:] = array
+            out = _map(directory, "out", np.float64, (len(INDICATOR_COLUMNS), n), "w+")
+            out[:] = np.nan
+            out.flush()
+
+            tasks = _partition(list(_groups(asset_ids)), self.workers * 4)
+            futures = [self.pool.submit(_compute_ranges, directory, n, ranges) for ranges in tasks]
+            for future in futures:
+                future.result()
+
+            # Copy out before the files go away
+            return {column: np.array(out[k]) for k, column in enumerate(INDICATOR_COLUMNS)}
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,235 @@
+import numpy as np
+from scipy.signal import lfilter
+
+# Every indicator and every intermediate it is built from is a node with
+# declared parameters and dependencies. A request for several indicators is
+# planned into one DAG, so an intermediate shared by many of them (an EMA,
+# the true range, a rolling sum) is computed once per symbol. Arrays are
+# always full length, NaN until a value is defined.
+
+REGISTRY = {}
+
+SOURCES = ("open", "high", "low", "close", "volume")
+
+class Node:
+    __slots__ = ("name", "defaults", "deps", "func", "outputs")
+
+    def __init__(self, name, defaults, deps, func, outputs):
+        self.name = name
+        self.defaults = defaults
+        self.deps = deps
+        self.func = func
+        self.outputs = outputs
+
+def register(name, deps=None, outputs=None, **defaults):
+    """
+    Register `func(*dep_results, **params)` as node `name`.
+
+    `deps(params)` returns the (name, params) pairs the node reads, in the
+    order they are passed in. `outputs` names the keys of a dict result for
+    nodes that return several series.
+    """
+    def decorator(func):
+        REGISTRY[name] = Node(name, defaults, deps or (lambda params: []), func, outputs)
+        return func
+    return decorator
+
+def node_key(name, params=None):
+    """Canonical (name, params) identity, with defaults filled in."""
+    if name not in REGISTRY:
+        raise KeyError(f"Unknown indicator: {name}")
+    node = REGISTRY[name]
+    unknown = set(params or ()) - set(node.defaults)
+    if unknown:
+        raise ValueError(f"{name} does not take {', '.join(sorted(unknown))}")
+    full = {**node.defaults, **(params or {})}
+    return name, tuple(sorted(full.items()))
+
+def series_name(key, output=None):
+    """Stable label for one stored series, e.g. 'macd(fast=12,signal=9,slow=26,source=close).hist'."""
+    name, params = key
+    label = f"{name}({','.join(f'{k}={v}' for k, v in params)})"
+    return f"{label}.{output}" if output else label
+
+def plan(requests):
+    """Dependencies-first order of every node needed for `requests` ((name, params) pairs)."""
+    order, done, visiting = [], set(), set()
+
+    def visit(key):
+        if key in done:
+            return
+        if key in visiting:
+            raise ValueError(f"Dependency cycle at {series_name(key)}")
+        visiting.add(key)
+        name, params = key
+        for dep in REGISTRY[name].deps(dict(params)):
+            visit(node_key(*dep))
+        visiting.discard(key)
+        done.add(key)
+        order.append(key)
+
+    for name, params in requests:
+        visit(node_key(name, params))
+    return order
+
+def evaluate(bars, requests):
+    """
+    Compute `requests` over one symbol's bars ({column: array}, time ordered).
+
+    Returns {key: result} for the requested keys only; a result is an array,
+    or a dict of arrays for multi-output nodes.
+    """
+    memo = {}
+    for key in plan(requests):
+        name, params = key
+        node = REGISTRY[name]
+        params = dict(params)
+        if name in SOURCES:
+            memo[key] = np.asarray(bars[name], dtype=np.float64)
+            continue
+        inputs = [memo[node_key(*dep)] for dep in node.deps(params)]
+        memo[key] = node.func(*inputs, **params)
+    return {node_key(name, params): memo[node_key(name, params)] for name, params in requests}
+
+def flatten(results):
+    """{series_name: array} with one entry per output of each result."""
+    series = {}
+    for key, result in results.items():
+        if isinstance(result, dict):
+            for output, values in result.items():
+                series[series_name(key, output)] = values
+        else:
+            series[series_name(key)] = result
+    return series
+
+# --- numerics ---------------------------------------------------------------
+
+def smooth(x, period, alpha):
+    """
+    Running average matching indicators.streaming.Smoother: NaN until
+    `period` valid inputs, seeded with their mean, then
+    y[t] = (1 - alpha) * y[t-1] + alpha * x[t]. Leading NaNs are skipped.
+    """
+    out = np.full(len(x), np.nan)
+    valid = np.flatnonzero(~np.isnan(x))
+    if len(valid) == 0:
+        return out
+    first = valid[0]
+    if len(x) - first < period:
+        return out
+    seed = x[first:first + period].mean()
+    out[first + period - 1] = seed
+    if len(x) > first + period:
+        out[first + period:], _ = lfilter([alpha], [1, alpha - 1], x[first + period:], zi=[(1 - alpha) * seed])
+    return out
+
+def ema_values(x, period):
+    return smooth(x, period, 2 / (period + 1))
+
+def wilder_values(x, period):
+    return smooth(x, period, 1 / period)
+
+def _source(params):
+    return [(params["source"], {})]
+
+# --- sources and intermediates ----------------------------------------------
+
+for _name in SOURCES:
+    register(_name)(None)
+
+@register("change", deps=_source, source="close")
+def change(x, source):
+    out = np.full(len(x), np.nan)
+    out[1:] = np.diff(x)
+    return out
+
+@register("ema", deps=_source, source="close", period=20)
+def ema(x, source, period):
+    return ema_values(x, period)
+
+@register("rolling_sum", deps=_source, source="close", period=20)
+def rolling_sum(x, source, period):
+    out = np.full(len(x), np.nan)
+    if len(x) >= period:
+        sums = np.cumsum(np.concatenate(([0.0], x)))
+        out[period - 1:] = sums[period:] - sums[:-period]
+    return out
+
+@register("rolling_sumsq", deps=_source, source="close", period=20)
+def rolling_sumsq(x, source, period):
+    return rolling_sum(x * x, source, period)
+
+@register("true_range", deps=lambda p: [("high", {}), ("low", {}), ("close", {})])
+def true_range(high, low, close):
+    out = np.full(len(close), np.nan)
+    prev_close = close[:-1]
+    out[1:] = np.maximum.reduce([high[1:] - low[1:], np.abs(high[1:] - prev_close), np.abs(low[1:] - prev_close)])
+    return out
+
+@register("directional_movement", deps=lambda p: [("high", {}), ("low", {})], outputs=("plus", "minus"))
+def directional_movement(high, low):
+    plus = np.full(len(high), np.nan)
+    minus = np.full(len(high), np.nan)
+    up = high[1:] - high[:-1]
+    down = low[:-1] - low[1:]
+    plus[1:] = np.where((up > down) & (up > 0), up, 0.0)
+    minus[1:] = np.where((down > up) & (down > 0), down, 0.0)
+    return {"plus": plus, "minus": minus}
+
+# --- indicators -------------------------------------------------------------
+
+@register("sma", deps=lambda p: [("rolling_sum", p)], source="close", period=20)
+def sma(sums, source, period):
+    return sums / period
+
+@register("atr", deps=lambda p: [("true_range", {})], period=14)
+def atr(tr, period):
+    return wilder_values(tr, period)
+
+@register("rsi", deps=lambda p: [("change", {"source": p["source"]})], source="close", period=14)
+def rsi(diff, source, period):
+    gain = wilder_values(np.maximum(diff, 0.0), period)
+    loss = wilder_values(np.maximum(-diff, 0.0), period)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out = np.where(loss == 0, np.where(gain > 0, 100.0, 50.0), 100 - 100 / (1 + gain / loss))
+    out[np.isnan(loss)] = np.nan
+    return out
+
+@register(
+    "macd",
+    deps=lambda p: [("ema", {"source": p["source"], "period": p["fast"]}), ("ema", {"source": p["source"], "period": p["slow"]})],
+    outputs=("macd", "signal", "hist"),
+    source="close", fast=12, slow=26, signal=9,
+)
+def macd(fast_ema, slow_ema, source, fast, slow, signal):
+    line = fast_ema - slow_ema
+    signal_line = ema_values(line, signal)
+    return {"macd": line, "signal": signal_line, "hist": line - signal_line}
+
+@register(
+    "adx",
+    deps=lambda p: [("atr", {"period": p["period"]}), ("directional_movement", {})],
+    outputs=("adx", "plus", "minus"),
+    period=14,
+)
+def adx(smoothed_tr, movement, period):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        plus = np.where(smoothed_tr != 0, 100 * wilder_values(movement["plus"], period) / smoothed_tr, 0.0)
+        minus = np.where(smoothed_tr != 0, 100 * wilder_values(movement["minus"], period) / smoothed_tr, 0.0)
+        dx = np.where(plus + minus != 0, 100 * np.abs(plus - minus) / (plus + minus), 0.0)
+    missing = np.isnan(smoothed_tr)
+    plus[missing] = minus[missing] = dx[missing] = np.nan
+    return {"adx": wilder_values(dx, period), "plus": plus, "minus": minus}
+
+@register(
+    "bbands",
+    deps=lambda p: [("rolling_sum", {"source": p["source"], "period": p["period"]}),
+                    ("rolling_sumsq", {"source": p["source"], "period": p["period"]})],
+    outputs=("lower", "mid", "upper"),
+    source="close", period=20, std=2.0,
+)
+def bbands(sums, sumsq, source, period, std):
+    mid = sums / period
+    # Population standard deviation from the two rolling sums
+    deviation = np.sqrt(np.maximum(sumsq / period - mid * mid, 0.0))
+    return {"lower": mid - std * deviation, "mid": mid, "upper": mid + std * deviation}
@@ -0,0 +1,202 @@
+import asyncio
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from config import *
+from alpaca.data.historical import StockHistoricalDataClient
+from alpaca.data.requests import StockBarsRequest
+from alpaca.data.timeframe import TimeFrame
+from alpaca.trading.client import TradingClient
+from alpaca.trading.requests import GetCalendarRequest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.database import async_session_maker
+from db.bulk import price_frame, copy_prices, copy_upsert
+from db.timeframes import refresh_aggregates
+from data.symbols import registry
+from data.subscriptions import get_stream_symbols
+from scripts.populate_prices import fetch_bars
+
+EASTERN = ZoneInfo("America/New_York")
+MINUTE = timedelta(minutes=1)
+
+# Alpaca's newest minutes can still be filling in, so a fetched span only
+# counts as checked up to this long ago
+CHECK_DELAY = timedelta(minutes=30)
+
+# Only the edges of each run of consecutive minutes come back, not every row
+ISLAND_EDGES = text("""
+    SELECT asset_id, datetime, prev, next FROM (
+        SELECT asset_id, datetime,
+               lag(datetime) OVER w AS prev,
+               lead(datetime) OVER w AS next
+        FROM asset_price
+        WHERE asset_id = ANY(:asset_ids) AND datetime >= :start AND datetime < :end
+        WINDOW w AS (PARTITION BY asset_id ORDER BY datetime)
+    ) edges
+    WHERE prev IS NULL OR next IS NULL
+       OR datetime - prev > interval '1 minute'
+       OR next - datetime > interval '1 minute'
+    ORDER BY asset_id, datetime
+""")
+
+CHECKED_SPANS = text("""
+    SELECT asset_id, span_start, span_end FROM gap_check
+    WHERE asset_id = ANY(:asset_ids) AND span_end > :start AND span_start < :end
+""")
+
+# Checks older than the scanned sessions are never read again
+PRUNE_CHECKS = text("DELETE FROM gap_check WHERE span_end < :start")
+
+def get_sessions(days):
+    """(open, close) for each trading session in the last `days` days, naive US/Eastern."""
+    trading_client = TradingClient(ALPACA_KEY, ALPACA_SECRET)
+    today = datetime.now(EASTERN).date()
+    calendar = trading_client.get_calendar(GetCalendarRequest(start=today - timedelta(days=days), end=today))
+
+    now = datetime.now(EASTERN).replace(tzinfo=None, second=0, microsecond=0)
+    sessions = []
+    for day in calendar:
+        if day.open >= now:
+            continue
+        sessions.append((day.open, min(day.close, now)))
+    return sessions
+
+def _islands(edges):
+    # Each island starts on a row with no neighbour before it and ends on a
+    # row with no neighbour after it
+    islands = []
+    start = None
+    for _, dt, prev, next_ in edges:
+        if prev is None or dt - prev > MINUTE:
+            start = dt
+        if next_ is None or next_ - dt > MINUTE:
+            islands.append((start, dt + MINUTE))
+    return islands
+
+def _missing(islands, sessions, min_gap):
+    gaps = []
+    for open_, close in sessions:
+        cursor = open_
+        for start, end in islands:
+            if end <= cursor or start >= close:
+                continue
+            if start > cursor:
+                gaps.append((cursor, start))
+            cursor = max(cursor, end)
+        if cursor < close:
+            gaps.append((cursor, close))
+    return [(start, end) for start, end in gaps if end - start >= min_gap]
+
+async def find_gaps(db: AsyncSession, asset_ids, sessions, min_gap=MINUTE):
+    """
+    Missing [start, end) minute ranges inside trading sessions, per asset_id.
+
+    Spans a previous run already fetched count as covered: an illiquid
+    symbol has minutes without trades that Alpaca never returns a bar for.
+    """
+    if not sessions or not asset_ids:
+        return {}
+
+    result = await db.execute(ISLAND_EDGES, {
+        "asset_ids": list(asset_ids),
+        "start": sessions[0][0],
+        "end": sessions[-1][1],
+    })
+
+    edges = {asset_id: [] for asset_id in asset_ids}
+    for row in result:
+        edges[row.asset_id].append(row)
+
+    result = await db.execute(CHECKED_SPANS, {
+        "asset_ids": list(asset_ids),
+        "start": sessions[0][0],
+        "end": sessions[-1][1],
+    })
+    checked = {asset_id: [] for asset_id in asset_ids}
+    for row in result:
+        checked[row.asset_id].append((row.span_start, row.span_end))
+
+    gaps = {}
+    for asset_id, rows in edges.items():
+        covered = sorted(_islands(rows) + checked[asset_id])
+        missing = _missing(covered, sessions, min_gap)
+        if missing:
+            gaps[asset_id] = missing
+    return gaps
+
+def group_gaps(gaps, merge_within=timedelta(minutes=30)):
+    """
+    Merge per-symbol gaps into a few (start, end, symbols) spans.
+
+    A stream outage leaves the same hole in every symbol, so overlapping or
+    nearby gaps share one multi-symbol request instead of one per symbol.
+    """
+    flat = sorted((start, end, symbol) for symbol, ranges in gaps.items() for start, end in ranges)
+
+    spans = []
+    for start, end, symbol in flat:
+        if spans and start <= spans[-1][1] + merge_within:
+            span = spans[-1]
+            span[1] = max(span[1], end)
+            span[2].add(symbol)
+        else:
+            spans.append([start, end, {symbol}])
+    return spans
+
+async def backfill_gaps(db: AsyncSession, days=5, symbols=None, min_gap=MINUTE, batch_size=100):
+    print("--- Starting Minute Gap Backfill ---")
+
+    if symbols is None:
+        symbols = await get_stream_symbols()
+    asset_map = await registry.get_many(symbols)
+    symbol_by_id = {asset_id: symbol for symbol, asset_id in asset_map.items()}
+
+    sessions = await asyncio.to_thread(get_sessions, days)
+    if sessions:
+        await db.execute(PRUNE_CHECKS, {"start": sessions[0][0]})
+    gaps = await find_gaps(db, list(symbol_by_id), sessions, min_gap)
+    gaps = {symbol_by_id[asset_id]: ranges for asset_id, ranges in gaps.items()}
+
+    missing_minutes = sum((end - start) // MINUTE for ranges in gaps.values() for start, end in ranges)
+    print(f"{len(gaps)} of {len(symbol_by_id)} symbols have gaps, {missing_minutes} minutes missing")
+
+    client = StockHistoricalDataClient(ALPACA_KEY, ALPACA_SECRET)
+    inserted = 0
+    filled = []
+    checked_until = datetime.now(EASTERN).replace(tzinfo=None) - CHECK_DELAY
+
+    for start, end, span_symbols in group_gaps(gaps):
+        span_symbols = sorted(span_symbols)
+        for i in range(0, len(span_symbols), batch_size):
+            request_params = StockBarsRequest(
+                symbol_or_symbols=span_symbols[i:i + batch_size],
+                timeframe=TimeFrame.Minute,
+                start=start.replace(tzinfo=EASTERN),
+                end=end.replace(tzinfo=EASTERN),
+            )
+            bars = (await fetch_bars(client, request_params)).df
+
+            # Rows already present are left untouched, so re-running is safe
+            if not bars.empty:
+                inserted += await copy_prices(db, price_frame(bars, asset_map), update=False)
+                filled.append((start, end))
+
+            # Whatever Alpaca did not return for the span has no bar to fetch
+            if start < checked_until:
+                checks = [(asset_map[symbol], start, min(end, checked_until)) for symbol in span_symbols[i:i + batch_size]]
+                await copy_upsert(db, "gap_check", ("asset_id", "span_start", "span_end"), checks, ("asset_id", "span_start"))
+            await db.commit()
+
+    # Gaps can be older than the aggregate refresh policies reach
+    if filled:
+        await refresh_aggregates(min(start for start, _ in filled), max(end for _, end in filled))
+
+    print(f"--- Gap Backfill Finished: {inserted} bars written ---")
+    return inserted
+
+async def main():
+    async with async_session_maker() as db:
+        await backfill_gaps(db)
+
+if __name__ == "__main__":
+    asyncio.run(main())
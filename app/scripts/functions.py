@@ -1,6 +1,45 @@
+import functools, json, os, time
 import requests
 import bs4 as bs # Using bs4 directly as per your function structure
 
+CACHE_DIR = os.environ.get("CACHE_DIR", "/tmp/tradeforge-cache")
+
+def disk_cache(name, ttl):
+    """
+    Cache a function's JSON-serializable result on disk for `ttl` seconds.
+
+    Empty results (a failed scrape returns []) are never cached, and if a
+    refresh comes back empty the last good copy is used instead, however old.
+    """
+    path = os.path.join(CACHE_DIR, f"{name}.json")
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                if time.time() - os.path.getmtime(path) < ttl:
+                    with open(path) as f:
+                        return json.load(f)
+            except (OSError, ValueError):
+                pass
+
+            result = func(*args, **kwargs)
+
+            if result:
+                os.makedirs(CACHE_DIR, exist_ok=True)
+                with open(path + ".tmp", "w") as f:
+                    json.dump(result, f)
+                os.replace(path + ".tmp", path)
+            elif os.path.exists(path):
+                print(f"{name} refresh came back empty, using the cached copy")
+                with open(path) as f:
+                    return json.load(f)
+
+            return result
+        return wrapper
+    return decorator
+
+@disk_cache("sp500_symbols", ttl=24 * 60 * 60)
 def get_sp500_symbols():
     """
     Scrapes the Wikipedia S&P 500 page to retrieve current constituent tickers.
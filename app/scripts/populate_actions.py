@@ -0,0 +1,135 @@
+import asyncio
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from config import *
+from alpaca.data.enums import CorporateActionsType
+from alpaca.data.historical.corporate_actions import CorporateActionsClient
+from alpaca.data.requests import CorporateActionsRequest
+from sqlalchemy import text
+from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.models import Asset
+from db.database import async_session_maker
+from db.bulk import copy_upsert
+from db.adjustments import bump_actions_version
+from data.symbols import registry
+from data.subscriptions import get_stream_symbols
+
+EASTERN = ZoneInfo("America/New_York")
+
+ACTION_TYPES = [
+    CorporateActionsType.FORWARD_SPLIT,
+    CorporateActionsType.REVERSE_SPLIT,
+    CorporateActionsType.STOCK_DIVIDEND,
+    CorporateActionsType.CASH_DIVIDEND,
+]
+
+ACTION_COLUMNS = ("id", "asset_id", "action_type", "ex_date", "old_rate", "new_rate", "cash", "price_factor", "volume_factor")
+
+# Last close before each ex-date, for the dividend factor. Assets that are
+# never streamed only have the loader's bars in asset_bar.
+PRIOR_CLOSES = text("""
+    SELECT a.asset_id, a.ex_date, p.close
+    FROM unnest(CAST(:asset_ids AS integer[]), CAST(:ex_dates AS date[])) AS a(asset_id, ex_date)
+    CROSS JOIN LATERAL (
+        SELECT close FROM (
+            SELECT datetime, close FROM asset_price_1d
+            WHERE asset_id = a.asset_id AND datetime < a.ex_date
+            UNION ALL
+            SELECT datetime, close FROM asset_bar
+            WHERE asset_id = a.asset_id AND datetime < a.ex_date
+        ) bars
+        ORDER BY datetime DESC
+        LIMIT 1
+    ) p
+""")
+
+def fetch_actions(symbols, start, end, batch_size=100):
+    """Splits and dividends for `symbols` with an ex-date in [start, end], as (type, action) pairs."""
+    client = CorporateActionsClient(ALPACA_KEY, ALPACA_SECRET)
+    actions = []
+    for i in range(0, len(symbols), batch_size):
+        request_params = CorporateActionsRequest(
+            symbols=symbols[i:i + batch_size],
+            types=ACTION_TYPES,
+            start=start,
+            end=end,
+        )
+        result = client.get_corporate_actions(request_params)
+        for action_type, items in result.data.items():
+            actions.extend((action_type, item) for item in items)
+    return actions
+
+def split_factors(action):
+    # new_rate shares for every old_rate: prices before scale down, volume up
+    return action.old_rate / action.new_rate, action.new_rate / action.old_rate
+
+async def populate_actions(db: AsyncSession, days=30, symbols=None):
+    """
+    Load recent splits and dividends and compute their adjustment factors.
+
+    Only actions whose ex-date has passed are stored, so bars are never
+    adjusted ahead of time. Dividends whose prior close is not in
+    asset_price yet are skipped and picked up on a later run.
+    """
+    print("--- Starting Corporate Actions Population ---")
+
+    if symbols is None:
+        result = await db.execute(select(Asset.symbol).where(Asset.is_sp500 == True))
+        symbols = {row[0] for row in result} | await get_stream_symbols()
+    asset_ids = await registry.get_many(sorted(symbols))
+
+    end = datetime.now(EASTERN).date()
+    start = end - timedelta(days=days)
+    actions = await asyncio.to_thread(fetch_actions, sorted(asset_ids), start, end)
+
+    records = []
+    dividends = []
+    for action_type, action in actions:
+        asset_id = asset_ids.get(action.symbol)
+        if asset_id is None or action.ex_date is None or action.ex_date > end:
+            continue
+
+        if action_type in ("forward_splits", "reverse_splits"):
+            if not action.old_rate or not action.new_rate:
+                continue
+            price_factor, volume_factor = split_factors(action)
+            records.append((action.id, asset_id, action_type, action.ex_date, action.old_rate, action.new_rate, None, price_factor, volume_factor))
+        elif action_type == "stock_dividends":
+            records.append((action.id, asset_id, action_type, action.ex_date, None, None, None, 1 / (1 + action.rate), 1 + action.rate))
+        elif action_type == "cash_dividends":
+            dividends.append((asset_id, action))
+
+    if dividends:
+        result = await db.execute(PRIOR_CLOSES, {
+            "asset_ids": [asset_id for asset_id, _ in dividends],
+            "ex_dates": [action.ex_date for _, action in dividends],
+        })
+        prior_close = {(row.asset_id, row.ex_date): row.close for row in result}
+
+        skipped = 0
+        for asset_id, action in dividends:
+            close = prior_close.get((asset_id, action.ex_date))
+            if not close or not 0 < action.rate < close:
+                skipped += 1
+                continue
+            records.append((action.id, asset_id, "cash_dividends", action.ex_date, None, None, action.rate, 1 - action.rate / close, 1.0))
+        if skipped:
+            print(f"Skipped {skipped} dividends without a prior close")
+
+    changed = await copy_upsert(db, "corporate_action", ACTION_COLUMNS, records, ("id",), changed_only=True)
+    await db.commit()
+
+    if changed:
+        await bump_actions_version()
+
+    print(f"--- Corporate Actions Finished: {changed} of {len(records)} actions inserted or updated ---")
+    return changed
+
+async def main():
+    async with async_session_maker() as db:
+        # First run: pull five years of history
+        await populate_actions(db, days=5 * 365)
+
+if __name__ == "__main__":
+    asyncio.run(main())
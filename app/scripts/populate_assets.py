@@ -8,9 +8,12 @@ from alpaca.trading.requests import GetAssetsRequest
 from alpaca.trading.enums import AssetStatus, AssetClass # Added AssetClass
 from scripts.functions import *
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
 from db.models import Asset, Base 
 from db.database import async_session_maker, engine
+from db.bulk import copy_upsert
+from db.schema import bootstrap
+from db.timeframes import refresh_aggregates
+from data.symbols import bump_asset_version
 from scripts.functions import *
 
 
@@ -29,12 +32,10 @@ async def get_session():
             await session.close()
 
 
-async def populate_assets(db: AsyncSession):
-    
-    print("--- Starting Asset Population Script ---")
-
-    sp500 = get_sp500_symbols()
-
+# Refreshed at most every 12 hours, so the nightly run always sees fresh data
+# but ad-hoc reruns during the day do not hit Alpaca again
+@disk_cache("alpaca_assets", ttl=12 * 60 * 60)
+def get_alpaca_assets():
     # Initialize Alpaca client
     trading_client = TradingClient(ALPACA_KEY, ALPACA_SECRET)
 
@@ -42,11 +43,11 @@ async def populate_assets(db: AsyncSession):
     # We use separate requests to avoid issues with non-standard Alpaca asset types
     TARGET_ASSET_CLASSES = [AssetClass.US_EQUITY, AssetClass.CRYPTO]
     assets = []
-    
+
     try:
         # Fetch assets from Alpaca, filtered by class
         print("Fetching assets from Alpaca (filtered to US_EQUITY and CRYPTO)...")
-        
+
         for target_class in TARGET_ASSET_CLASSES:
             print(f"  -> Fetching {target_class.value.upper()}...")
             search_params = GetAssetsRequest(
@@ -55,53 +56,53 @@ async def populate_assets(db: AsyncSession):
             )
             # The Alpaca SDK returns a list of Asset objects
             class_assets = trading_client.get_all_assets(search_params)
-            assets.extend(class_assets)
+            assets.extend(
+                {
+                    "symbol": asset.symbol,
+                    "name": asset.name,
+                    "exchange": asset.exchange.value,
+                    "asset_class": asset.asset_class.value,
+                }
+                for asset in class_assets
+            )
             print(f"  -> Found {len(class_assets)} {target_class.value.upper()} assets.")
-            
-        print(f"Total found assets: {len(assets)}.")
 
     except Exception as e:
         print(f"Error: {e}")
+        return []
+
+    return assets
+
+ASSET_COLUMNS = ("symbol", "name", "exchange", "asset_class", "is_sp500")
+
+async def populate_assets(db: AsyncSession):
+
+    print("--- Starting Asset Population Script ---")
+
+    sp500 = set(get_sp500_symbols())
+    assets = get_alpaca_assets()
+
+    if not assets:
+        print("No assets returned from Alpaca, nothing to do")
         return
 
-    # Check for existing assets to prevent duplicates
-    query = select(Asset.symbol)
-    result = await db.execute(query)
-    existing_assets = {row[0] for row in result.all()}
-
-    new_asset_count = 0
-    # Removed unused variable: update_count
-
-    for asset in assets:
-        symbol = asset.symbol
-        name = asset.name
-        exchange = asset.exchange
-        asset_class = asset.asset_class
-        # is_sp500 = False
-        # NOTE: Uncomment sp500 and etfs logic if you implement those functions
-
-        if symbol not in existing_assets:
-            is_sp500 = True if symbol in sp500 else False
-            try:
-                print(f"Inserting NEW asset: {symbol} - {name}")
-                new_asset = Asset(
-                    name=name,
-                    symbol=symbol,
-                    exchange=exchange,
-                    asset_class=asset_class.value,
-                    is_sp500=is_sp500 
-                )
-                db.add(new_asset)
-                new_asset_count += 1
-            except Exception as e:
-                print(f"ERROR inserting asset {symbol}: {e}")
-        else:
-            # Optionally, you might want to update existing asset data here
-            print(f"{symbol} already exists in database. Skipping...")
+    print(f"Total found assets: {len(assets)}.")
+
+    records = [
+        (asset["symbol"], asset["name"], asset["exchange"], asset["asset_class"], asset["symbol"] in sp500)
+        for asset in assets
+    ]
 
+    # One merge for the whole list: new symbols are inserted, existing ones are
+    # rewritten only when name, exchange, class or S&P 500 membership changed
+    changed = await copy_upsert(db, "asset", ASSET_COLUMNS, records, ("symbol",), changed_only=True)
     await db.commit()
+
+    if changed:
+        await bump_asset_version()
+
     print("--- Asset Population Script Finished ---")
-    print(f"Summary: Inserted {new_asset_count} new assets. Total processed: {len(assets)}")
+    print(f"Summary: {changed} assets inserted or updated. Total processed: {len(assets)}")
 
 
 # --- EXECUTION BLOCK (The fix) ---
@@ -110,8 +111,9 @@ async def main():
     
     # 1. Ensure tables exist (optional, but good for setup scripts)
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-        
+        await bootstrap(conn)
+    await refresh_aggregates()
+
     # 2. Acquire a session and run the population function
     async with get_session() as db:
         await populate_assets(db)
@@ -8,73 +8,224 @@ from alpaca.data.timeframe import TimeFrame, TimeFrameUnit
 from sqlalchemy.ext.asyncio import AsyncSession
 from dateutil.relativedelta import relativedelta
 from sqlalchemy.future import select
+from sqlalchemy import text
 from db.models import *
 from db.database import *
-import asyncio
+from db.bulk import MINUTE, price_frame, copy_prices
+from db.timeframes import LOADER_TIMEFRAME, refresh_aggregates
+from data.symbols import registry
+import argparse, asyncio, random, re, requests
 from concurrent.futures import ThreadPoolExecutor
 from zoneinfo import ZoneInfo
 
-async def fetch_bars(client, request_params):
-    loop = asyncio.get_event_loop()
-    with ThreadPoolExecutor() as pool:
-        bars = await loop.run_in_executor(pool, client.get_stock_bars, request_params)
-    return bars
-
-async def populate_prices(db: AsyncSession):
-
-    client = StockHistoricalDataClient(ALPACA_KEY, ALPACA_SECRET)
-
-    query = select(Asset)
+# Shared by every loader so concurrent fetches reuse the same threads
+EXECUTOR = ThreadPoolExecutor(max_workers=8)
+
+EASTERN = ZoneInfo("America/New_York")
+
+def parse_timeframe(value):
+    # TimeFrame.value round trip, e.g. "1Hour" → TimeFrame(1, TimeFrameUnit.Hour)
+    amount, unit = re.fullmatch(r"(\d+)(\w+)", value).groups()
+    return TimeFrame(int(amount), TimeFrameUnit(unit))
+
+# Next free request slot, shared through Redis so every process fetching
+# from Alpaca (pipelined loads, backfill workers, gap fills) draws on one limit.
+# Redis's own clock keeps workers on different hosts in step.
+RESERVE_SLOT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1e6
+local slot = math.max(tonumber(redis.call('GET', KEYS[1]) or 0), now)
+redis.call('SET', KEYS[1], tostring(slot + tonumber(ARGV[1])), 'EX', 300)
+return tostring(slot - now)
+"""
+
+class RateLimiter:
+    """
+    Spaces calls evenly so every process together stays under `calls` per
+    `period` seconds. Each acquire reserves the next slot in Redis and sleeps
+    until it comes up.
+    """
+
+    def __init__(self, calls=190, period=60, key="ratelimit:alpaca:data"):
+        self.interval = period / calls
+        self.key = key
+
+    async def acquire(self):
+        wait = float(await redis_client.eval(RESERVE_SLOT, 1, self.key, self.interval))
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+# Shared by every loader
+ALPACA_LIMITER = RateLimiter()
+
+def _is_transient(error):
+    status_code = getattr(error, "status_code", None)
+    if status_code is not None:
+        return status_code == 429 or status_code >= 500
+    return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+async def fetch_bars(client, request_params, limiter=ALPACA_LIMITER, retries=5):
+    loop = asyncio.get_running_loop()
+    for attempt in range(retries):
+        if limiter is not None:
+            await limiter.acquire()
+        try:
+            return await loop.run_in_executor(EXECUTOR, client.get_stock_bars, request_params)
+        except Exception as e:
+            if not _is_transient(e) or attempt == retries - 1:
+                raise
+            delay = min(30, 2 ** attempt) + random.random()
+            print(f"Transient error fetching bars ({e}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+# Newest stored bar per asset. The LATERAL subquery walks the
+# (asset_id, datetime) index backwards once per asset instead of
+# aggregating every row in asset_price.
+HIGH_WATER_MARKS = text("""
+    SELECT a.symbol, last.datetime
+    FROM asset a
+    CROSS JOIN LATERAL (
+        SELECT p.datetime FROM asset_price p
+        WHERE p.asset_id = a.id
+        ORDER BY p.datetime DESC
+        LIMIT 1
+    ) last
+    WHERE a.asset_class = :asset_class
+""")
+
+# The same for one coarser timeframe in asset_bar, along its primary key
+BAR_HIGH_WATER_MARKS = text("""
+    SELECT a.symbol, last.datetime
+    FROM asset a
+    CROSS JOIN LATERAL (
+        SELECT b.datetime FROM asset_bar b
+        WHERE b.asset_id = a.id AND b.timeframe = :timeframe
+        ORDER BY b.datetime DESC
+        LIMIT 1
+    ) last
+    WHERE a.asset_class = :asset_class
+""")
+
+def bucket_start(dt, timeframe):
+    """Floor a timestamp to the start of its `timeframe` bar."""
+    unit = timeframe.unit_value
+    amount = timeframe.amount_value
+    if unit == TimeFrameUnit.Minute:
+        return dt.replace(minute=dt.minute - dt.minute % amount, second=0, microsecond=0)
+    if unit == TimeFrameUnit.Hour:
+        return dt.replace(hour=dt.hour - dt.hour % amount, minute=0, second=0, microsecond=0)
+    return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+
+async def high_water_marks(db: AsyncSession, timeframe, asset_class="us_equity"):
+    """
+    Where each symbol's next fetch should start: the start of the bar holding
+    its newest stored row at `timeframe`, so a partial last bar is refreshed too.
+    """
+    if timeframe.value == MINUTE:
+        result = await db.execute(HIGH_WATER_MARKS, {"asset_class": asset_class})
+    else:
+        result = await db.execute(BAR_HIGH_WATER_MARKS, {"asset_class": asset_class, "timeframe": timeframe.value})
+    return {symbol: bucket_start(last, timeframe) for symbol, last in result.all()}
+
+async def plan_batches(db: AsyncSession, timeframe=TimeFrame.Hour, batch_size=100, lookback_days=7):
+    """
+    Split every US equity into fetch batches.
+
+    Returns ({symbol: start}, [symbol batches], now). Each symbol starts at its
+    high-water mark for `timeframe`, or `lookback_days` back if it has none.
+    Symbols are sorted by start so a batch's first symbol has the earliest one.
+    """
+    query = select(Asset.symbol).where(Asset.asset_class == "us_equity")
     result = await db.scalars(query)
-    existing_assets = result.all()
-
-    stock_symbols = []
-
-    for existing_asset in existing_assets:
-        if existing_asset.asset_class == "us_equity":
-            stock_symbols.append(existing_asset.symbol)
-
-    asset_dict = {}
-
-    for asset in existing_assets:
-        asset_dict[asset.symbol] = asset.id
+    stock_symbols = result.all()
+
+    now = datetime.now(EASTERN).replace(tzinfo=None)
+    default_start = now - relativedelta(days=lookback_days)
+    marks = await high_water_marks(db, timeframe)
+    since = {symbol: marks.get(symbol, default_start) for symbol in stock_symbols}
+
+    ordered = sorted(stock_symbols, key=since.__getitem__)
+    batches = [ordered[i:i + batch_size] for i in range(0, len(ordered), batch_size)]
+    print(f"{len(marks)} symbols have stored bars, {len(stock_symbols) - len(marks)} start from {default_start:%Y-%m-%d}")
+    return since, batches, now
+
+async def populate_prices(db: AsyncSession, timeframe=TimeFrame.Hour, concurrency=4, batch_size=100, lookback_days=7):
+    """
+    Load new bars for every US equity.
+
+    Each symbol is fetched from its high-water mark for `timeframe`; symbols
+    with no stored bars go back `lookback_days`. Symbols are sorted by mark and
+    batched, so a routine refresh asks only for the last few bars.
+
+    Up to `concurrency` batch fetches run at once behind the shared rate limiter
+    while a single writer converts finished batches with vectorized pandas and
+    COPYs them in, so the network and the database are busy at the same time.
+    Minute bars go to asset_price, anything coarser to asset_bar.
+    """
+    client = StockHistoricalDataClient(ALPACA_KEY, ALPACA_SECRET)
 
-    batch_size = 100
+    asset_dict = await registry.mapping()
+    since, batches, now = await plan_batches(db, timeframe, batch_size, lookback_days)
+    stock_symbols = list(since)
 
-    for i in range(0, len(existing_assets), batch_size):
-        symbol_batch = stock_symbols[i:i+batch_size]
+    semaphore = asyncio.Semaphore(concurrency)
+    # Bounded so fetchers wait for the writer instead of piling up frames
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    failed = []
+    inserted = 0
 
+    async def fetch(symbol_batch):
         request_params = StockBarsRequest(
                             symbol_or_symbols=symbol_batch,
-                            timeframe=TimeFrame.Hour,
-                            start=datetime.now() - relativedelta(days=7),
-                            end=datetime.today()
+                            timeframe=timeframe,
+                            start=since[symbol_batch[0]].replace(tzinfo=EASTERN),
+                            end=now.replace(tzinfo=EASTERN)
                         )
-        
-        bars = await fetch_bars(client, request_params)
-        bars = bars.df
-
-        to_insert = []
-
-        for row in bars.itertuples():
-            symbol, timestamp = row.Index
-
-            timestamp = timestamp.astimezone(ZoneInfo("America/New_York"))
-
-            timestamp = timestamp.replace(tzinfo=None)
-
-            print(f"Inserting bar for {symbol} at {timestamp}")
-
-            bar = AssetPrice(
-                asset_id=asset_dict[symbol],
-                datetime=timestamp,
-                open=row.open,
-                high=row.high,
-                low=row.low,
-                close=row.close,
-                volume=row.volume,
-            )
-            to_insert.append(bar)
-
-        db.add_all(to_insert)
-        await db.commit()
\ No newline at end of file
+        async with semaphore:
+            try:
+                bars = await fetch_bars(client, request_params)
+            except Exception as e:
+                print(f"Failed to fetch batch starting {symbol_batch[0]}: {e}")
+                failed.append(symbol_batch)
+                return
+        await queue.put((symbol_batch, bars.df))
+
+    async def write():
+        nonlocal inserted
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            symbol_batch, bars = item
+            try:
+                frame = price_frame(bars, asset_dict, since)
+                count = await copy_prices(db, frame, timeframe=timeframe.value)
+                await db.commit()
+                inserted += count
+                print(f"Inserted {count} bars for batch starting {symbol_batch[0]}")
+            except Exception as e:
+                await db.rollback()
+                print(f"Failed to write batch starting {symbol_batch[0]}: {e}")
+                failed.append(symbol_batch)
+
+    writer = asyncio.create_task(write())
+    await asyncio.gather(*(fetch(batch) for batch in batches))
+    await queue.put(None)
+    await writer
+
+    if inserted and timeframe.value == MINUTE:
+        await refresh_aggregates(min(since.values()), now)
+
+    print(f"Loaded {inserted} bars for {len(stock_symbols)} symbols, {len(failed)} batches failed")
+    return failed
+
+async def main(timeframe=LOADER_TIMEFRAME, lookback_days=7):
+    async with async_session_maker() as db:
+        await populate_prices(db, parse_timeframe(timeframe), lookback_days=lookback_days)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load new bars for every US equity in this process")
+    parser.add_argument("--timeframe", default=LOADER_TIMEFRAME, help='Alpaca timeframe, e.g. "1Min" or "1Hour"')
+    parser.add_argument("--lookback-days", type=int, default=7, help="how far back symbols with no stored bars start")
+    args = parser.parse_args()
+    asyncio.run(main(args.timeframe, args.lookback_days))
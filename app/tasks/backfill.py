@@ -0,0 +1,176 @@
+from datetime import datetime
+from celery import chord, group
+from alpaca.data.historical import StockHistoricalDataClient
+from alpaca.data.requests import StockBarsRequest
+from alpaca.data.timeframe import TimeFrame
+from sqlalchemy import func, update
+from sqlalchemy.future import select
+from config import *
+from db.models import BackfillJob, BackfillBatch
+from db.database import async_session_maker
+from db.bulk import MINUTE, price_frame, copy_prices
+from db.timeframes import LOADER_TIMEFRAME, refresh_aggregates
+from data.symbols import registry
+from scripts.populate_prices import EASTERN, fetch_bars, parse_timeframe, plan_batches
+from tasks.tasks import celery
+from tasks.runtime import async_task
+
+# A job is split into BackfillBatch rows up front, one per symbol batch, and
+# each batch runs as its own task so the load spreads across every worker.
+# Batch state lives in Postgres rather than the result backend, so progress
+# survives worker restarts and a job can be resumed from its unfinished batches.
+
+async def create_price_job(timeframe=TimeFrame.Hour, batch_size=100, lookback_days=7):
+    async with async_session_maker() as session:
+        since, batches, now = await plan_batches(session, timeframe, batch_size, lookback_days)
+
+        job = BackfillJob(
+            kind="prices",
+            timeframe=timeframe.value,
+            status="running",
+            total_batches=len(batches),
+            created_at=datetime.now(EASTERN).replace(tzinfo=None),
+        )
+        session.add(job)
+        await session.flush()
+
+        session.add_all(
+            BackfillBatch(job_id=job.id, batch_no=batch_no, symbols=symbols, start=since[symbols[0]], end=now)
+            for batch_no, symbols in enumerate(batches)
+        )
+        await session.commit()
+        return job.id, len(batches)
+
+async def pending_batches(job_id):
+    async with async_session_maker() as session:
+        result = await session.scalars(
+            select(BackfillBatch.batch_no)
+            .where(BackfillBatch.job_id == job_id, BackfillBatch.status != "done")
+            .order_by(BackfillBatch.batch_no)
+        )
+        return result.all()
+
+def dispatch(job_id, batch_numbers):
+    """Queue one task per batch; finish_backfill runs once they have all returned."""
+    if not batch_numbers:
+        finish_backfill.delay([], job_id)
+        return None
+    header = group(backfill_price_batch.s(job_id, batch_no) for batch_no in batch_numbers)
+    return chord(header)(finish_backfill.s(job_id))
+
+@async_task(celery)
+async def run_price_backfill(timeframe=LOADER_TIMEFRAME, batch_size=100, lookback_days=7):
+    job_id, total = await create_price_job(parse_timeframe(timeframe), batch_size, lookback_days)
+    print(f"Backfill job {job_id}: {total} batches queued")
+    dispatch(job_id, list(range(total)))
+    return job_id
+
+@async_task(celery)
+async def resume_backfill(job_id):
+    """Re-queue every batch of `job_id` that has not finished."""
+    batch_numbers = await pending_batches(job_id)
+    await _set_job_status(job_id, "running")
+    print(f"Backfill job {job_id}: resuming {len(batch_numbers)} batches")
+    dispatch(job_id, batch_numbers)
+
+# Exceptions are caught and recorded on the batch instead of raised: a failed
+# header task would keep the chord callback from ever running
+@async_task(celery, acks_late=True)
+async def backfill_price_batch(job_id, batch_no):
+    async with async_session_maker() as session:
+        batch = await session.get(BackfillBatch, (job_id, batch_no))
+        job = await session.get(BackfillJob, job_id)
+        if batch is None or batch.status == "done":
+            return True
+
+        batch.status = "running"
+        batch.attempts += 1
+        await session.commit()
+
+        try:
+            client = StockHistoricalDataClient(ALPACA_KEY, ALPACA_SECRET)
+            request_params = StockBarsRequest(
+                symbol_or_symbols=batch.symbols,
+                timeframe=parse_timeframe(job.timeframe),
+                start=batch.start.replace(tzinfo=EASTERN),
+                end=batch.end.replace(tzinfo=EASTERN),
+            )
+            bars = await fetch_bars(client, request_params)
+            asset_ids = await registry.get_many(batch.symbols)
+            count = await copy_prices(session, price_frame(bars.df, asset_ids), timeframe=job.timeframe)
+            batch.status = "done"
+            batch.bars = count
+            batch.error = None
+        except Exception as e:
+            await session.rollback()
+            batch = await session.get(BackfillBatch, (job_id, batch_no))
+            batch.status = "failed"
+            batch.error = str(e)[:1000]
+            print(f"Backfill job {job_id} batch {batch_no} failed: {e}")
+
+        await session.commit()
+        return batch.status == "done"
+
+async def _set_job_status(job_id, status):
+    async with async_session_maker() as session:
+        finished_at = datetime.now(EASTERN).replace(tzinfo=None) if status != "running" else None
+        await session.execute(
+            update(BackfillJob).where(BackfillJob.id == job_id).values(status=status, finished_at=finished_at)
+        )
+        await session.commit()
+
+async def job_progress(session, job_id):
+    """Batch counts by status plus bars written, for the progress endpoint."""
+    job = await session.get(BackfillJob, job_id)
+    if job is None:
+        return None
+
+    result = await session.execute(
+        select(BackfillBatch.status, func.count(), func.coalesce(func.sum(BackfillBatch.bars), 0))
+        .where(BackfillBatch.job_id == job_id)
+        .group_by(BackfillBatch.status)
+    )
+    counts = {status: (batches, bars) for status, batches, bars in result.all()}
+    failed = await session.scalars(
+        select(BackfillBatch.batch_no)
+        .where(BackfillBatch.job_id == job_id, BackfillBatch.status == "failed")
+        .order_by(BackfillBatch.batch_no)
+    )
+
+    done = counts.get("done", (0, 0))[0]
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "timeframe": job.timeframe,
+        "status": job.status,
+        "total_batches": job.total_batches,
+        "batches": {status: batches for status, (batches, _) in counts.items()},
+        "progress": round(done / job.total_batches, 4) if job.total_batches else 1.0,
+        "bars": sum(bars for _, bars in counts.values()),
+        "failed_batches": failed.all(),
+        "created_at": job.created_at.isoformat(),
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+async def loaded_range(job_id):
+    """(timeframe, earliest start, latest end) over the job's finished batches."""
+    async with async_session_maker() as session:
+        job = await session.get(BackfillJob, job_id)
+        result = await session.execute(
+            select(func.min(BackfillBatch.start), func.max(BackfillBatch.end))
+            .where(BackfillBatch.job_id == job_id, BackfillBatch.status == "done")
+        )
+        start, end = result.one()
+        return job.timeframe, start, end
+
+@async_task(celery)
+async def finish_backfill(results, job_id):
+    status = "completed" if all(results) else "failed"
+    # History older than the refresh policies' window only reaches the
+    # aggregates through an explicit refresh. Coarser jobs land in asset_bar,
+    # which the aggregates do not read.
+    timeframe, start, end = await loaded_range(job_id)
+    if timeframe == MINUTE and start is not None:
+        await refresh_aggregates(start, end)
+    await _set_job_status(job_id, status)
+    print(f"Backfill job {job_id} {status}: {sum(1 for ok in results if ok)} of {len(results)} batches loaded")
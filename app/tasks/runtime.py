@@ -0,0 +1,65 @@
+import asyncio
+import functools
+from celery.signals import worker_process_init, worker_process_shutdown
+from config import redis_client
+from db.database import engine
+from data import candle_bus
+
+# One event loop per worker process, created when the process starts and
+# reused by every task it runs. The engine's pool, the asyncio redis clients
+# and any module-level asyncio.Lock bind to the loop they are first used on,
+# so keeping a single loop lets connections survive from one task to the next.
+_loop = None
+
+def get_loop():
+    global _loop
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_loop)
+    return _loop
+
+def run(coro):
+    """Run a coroutine to completion on this process's loop."""
+    return get_loop().run_until_complete(coro)
+
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    # A forked child inherits the parent's pooled connections. Forget them
+    # without closing, since the parent still owns the sockets.
+    engine.sync_engine.dispose(close=False)
+    get_loop()
+
+@worker_process_shutdown.connect
+def shutdown_worker_process(**kwargs):
+    global _loop
+    if _loop is None or _loop.is_closed():
+        return
+
+    async def close():
+        await engine.dispose()
+        await redis_client.aclose()
+        await candle_bus.bus.aclose()
+
+    try:
+        _loop.run_until_complete(close())
+    finally:
+        _loop.close()
+        _loop = None
+
+def async_task(app, **options):
+    """
+    Register a coroutine function as a Celery task run on the process loop.
+
+        @async_task(celery)
+        async def run_something():
+            ...
+
+    The task keeps the coroutine's module and name, so beat schedules and
+    .delay() callers do not change.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return run(func(*args, **kwargs))
+        return app.task(**options)(wrapper)
+    return decorator
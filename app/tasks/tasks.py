@@ -1,20 +1,30 @@
 from fastapi import Depends
-from datetime import datetime
+from datetime import datetime, timedelta
 from celery import Celery
 from celery.schedules import crontab
 from scripts.populate_assets import populate_assets
+from scripts.backfill_gaps import backfill_gaps
+from scripts.populate_actions import populate_actions
+from indicators.batch import rebuild_indicators, rebuild_indicator_values, STORED_INDICATORS, VALUE_TIMEFRAMES
 from db.models import *
 from db.database import *
-import asyncio, json
-from data import aggregator
-from sqlalchemy.future import select
+from data import candle_bus
+from data.symbols import registry
+from db.bulk import upsert_prices
+from zoneinfo import ZoneInfo
+from tasks.runtime import async_task
 
-redis = redis.Redis(host="redis", port=6379, decode_responses=True)
+EASTERN = ZoneInfo("America/New_York")
+
+# The nightly indicator rebuild warms up on full history but only rewrites
+# rows this recent, which covers late gap fills and backfills
+INDICATOR_REWRITE_DAYS = 7
 
 celery = Celery(
     "worker",
     broker="redis://redis:6379/0",
     backend="redis://redis:6379/0",
+    include=["tasks.backfill"],
 )
 
 celery.conf.timezone = "US/Eastern"
@@ -27,73 +37,97 @@ celery.conf.beat_schedule = {
     "run-populate-candles": {
         "task": "tasks.tasks.run_populate_candles",
         "schedule": crontab(minute="*/5")
+    },
+    "run-backfill-gaps": {
+        "task": "tasks.tasks.run_backfill_gaps",
+        "schedule": crontab(minute=30, hour=20, day_of_week='1-5'),
+    },
+    "run-populate-actions": {
+        "task": "tasks.tasks.run_populate_actions",
+        "schedule": crontab(minute=0, hour=7, day_of_week='1-5'),
+    },
+    "run-rebuild-indicators": {
+        "task": "tasks.tasks.run_rebuild_indicators",
+        "schedule": crontab(minute=0, hour=21, day_of_week='1-5'),
     }
 }
 
-@celery.task
-def run_populate_assets():
-    loop = asyncio.get_event_loop()
+@async_task(celery)
+async def run_populate_assets():
+    async with async_session_maker() as session:
+        await populate_assets(session)
 
-    if loop.is_closed():
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+@async_task(celery)
+async def run_backfill_gaps():
+    async with async_session_maker() as session:
+        await backfill_gaps(session)
 
-    loop.run_until_complete(_run())
+@async_task(celery)
+async def run_populate_actions():
+    async with async_session_maker() as session:
+        await populate_actions(session)
 
-async def _run():
+@async_task(celery)
+async def run_rebuild_indicators():
+    since = datetime.now(EASTERN).replace(tzinfo=None) - timedelta(days=INDICATOR_REWRITE_DAYS)
     async with async_session_maker() as session:
-        await populate_assets(session)
+        await rebuild_indicators(session, since=since)
+        for timeframe in VALUE_TIMEFRAMES:
+            await rebuild_indicator_values(session, STORED_INDICATORS, timeframe=timeframe, since=since)
 
-@celery.task
-def run_populate_candles():
-    try:
-        loop = asyncio.get_event_loop()
-    except RuntimeError:
-        # No event loop in current thread
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+@async_task(celery)
+async def run_populate_candles():
+    await _save()
 
-    if loop.is_closed():
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+async def _save():
+    await candle_bus.ensure_group()
+    consumer = candle_bus.consumer_name()
 
-    loop.run_until_complete(_save())
+    # Bars a dead worker read but never acked come first, then new ones
+    batch = await candle_bus.claim_stale(consumer)
+    total = 0
 
-async def _save():
-    async with async_session_maker() as session:  # type: AsyncSession
-        # Pull all staged candles from Redis
-        bars = []
-        while True:
-            raw = await redis.lpop("candles")
-            if not raw:
+    while True:
+        if not batch:
+            batch = await candle_bus.read_bars(consumer, count=5000)
+            if not batch:
                 break
-            bars.append(json.loads(raw))
-
-        if not bars:
-            print("No candles in Redis.")
-            return
-
-        # Build asset_id map
-        result = await session.execute(select(Asset))
-        asset_map = {a.symbol: a.id for a in result.scalars()}
-
-        # Save to DB
-        to_insert = []
-        for bar in bars:
-            bar["datetime"] = datetime.fromisoformat(bar["datetime"])
-            asset_id = asset_map.get(bar["symbol"])
-            if not asset_id:
-                continue
-            to_insert.append(AssetPrice(
-                asset_id=asset_id,
-                datetime=bar["datetime"],
-                open=bar["open"],
-                high=bar["high"],
-                low=bar["low"],
-                close=bar["close"],
-                volume=bar["volume"],
-            ))
-
-        session.add_all(to_insert)
-        await session.commit()
-        print(f"Inserted {len(to_insert)} candles to DB")
\ No newline at end of file
+
+        async with async_session_maker() as session:  # type: AsyncSession
+            total += await _write_bars(session, [bar for _, bar in batch])
+            await session.commit()
+
+        # Ack only after the commit; the upsert makes redelivery harmless
+        await candle_bus.ack([message_id for message_id, _ in batch])
+        batch = None
+
+    if not total:
+        print("No candles in Redis.")
+        return
+
+    print(f"Inserted {total} candles to DB")
+
+async def _write_bars(session, bars):
+    # Bars queued in the old JSON format still carry a symbol instead of an id
+    legacy = {bar["symbol"] for bar in bars if "asset_id" not in bar}
+    asset_map = await registry.get_many(legacy) if legacy else {}
+
+    to_insert = []
+    for bar in bars:
+        # asset_price holds minute bars; coarser candles are derived from them
+        if bar.get("interval", 60) != 60:
+            continue
+        asset_id = bar.get("asset_id") or asset_map.get(bar.get("symbol"))
+        if not asset_id:
+            continue
+        to_insert.append({
+            "asset_id": asset_id,
+            "datetime": bar["datetime"].astimezone(EASTERN).replace(tzinfo=None),
+            "open": bar["open"],
+            "high": bar["high"],
+            "low": bar["low"],
+            "close": bar["close"],
+            "volume": bar["volume"],
+        })
+
+    return await upsert_prices(session, to_insert)
@@ -5,6 +5,8 @@ from web.routes.base import router
 from contextlib import asynccontextmanager
 from db.models import *
 from db.database import *
+from db.schema import bootstrap
+from db.timeframes import refresh_aggregates
 from prom.metrics import router as metrics_router, prometheus_middleware
 from web.auth.auth import unauthorized_exception_handler
 
@@ -12,7 +14,9 @@ from web.auth.auth import unauthorized_exception_handler
 async def lifespan(app: FastAPI):
     # Run startup logic
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+        await bootstrap(conn)
+    # Outside the bootstrap transaction; slow only on the first run
+    await refresh_aggregates()
     yield
 
 app = FastAPI(lifespan=lifespan)
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, Request, BackgroundTasks
+from fastapi import APIRouter, Depends, Request, HTTPException
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse, RedirectResponse
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -8,11 +8,17 @@ from sqlalchemy import delete
 from db.models import *
 from db.database import *
 from db.schemas import AssetSchema
+from db.timeframes import LOADER_TIMEFRAME, get_bars
+from db.adjustments import adjustments, adjust_rows
 from pydantic import TypeAdapter
 from config import redis_client
 from scripts.populate_assets import *
 from scripts.populate_prices import *
 from web.auth.auth import *
+from data.subscriptions import notify_watchlist_changed
+from tasks.backfill import create_price_job, dispatch, resume_backfill, job_progress
+from indicators.cache import get_indicator, parse_params
+from datetime import datetime
 import json
 
 router = APIRouter(
@@ -80,25 +86,50 @@ async def assets(request: Request, asset_filter: str = "all", db: AsyncSession =
         **context
     })
 
+# Newest bars shown on the asset page, whatever the timeframe
+DETAIL_BARS = 1000
+
 @router.get("/asset/{symbol}")
-async def asset_detail(request: Request, symbol, db: AsyncSession = Depends(get_db), context: dict = Depends(get_authenticated_template_context)):
+async def asset_detail(request: Request, symbol, timeframe: str = "1d", adjusted: bool = True, db: AsyncSession = Depends(get_db), context: dict = Depends(get_authenticated_template_context)):
 
     query = select(Asset).where(Asset.symbol == symbol)
     asset = await db.scalar(query)
 
-    query = (
-        select(AssetPrice)
-        .where(AssetPrice.asset_id == asset.id)
-        .order_by(AssetPrice.datetime.desc())
-    )
-    prices_result = await db.scalars(query)
-    prices = prices_result.all()
+    try:
+        prices = await get_bars(db, asset.id, timeframe, limit=DETAIL_BARS, descending=True)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if adjusted:
+        prices = adjust_rows(prices, await adjustments.get(asset.id))
 
     strategies_query = select(Strategy)
     strategies_result = await db.scalars(strategies_query)
     strategies = strategies_result.all()
 
-    return templates.TemplateResponse("asset_detail.html", {"request": request, "asset": asset, "prices": prices, "strategies": strategies, **context})
+    return templates.TemplateResponse("asset_detail.html", {"request": request, "asset": asset, "prices": prices, "timeframe": timeframe, "adjusted": adjusted, "strategies": strategies, **context})
+
+# Query params other than these are passed to the indicator, e.g. ?period=21.
+# start/end without an offset are US/Eastern like asset_price.
+INDICATOR_QUERY = {"timeframe", "start", "end", "limit", "adjusted"}
+
+@router.get("/api/indicator/{symbol}/{name}")
+async def indicator_series(request: Request, symbol: str, name: str, timeframe: str = "1d", start: datetime | None = None, end: datetime | None = None, limit: int = 500, adjusted: bool = True, db: AsyncSession = Depends(get_db)):
+
+    query = select(Asset).where(Asset.symbol == symbol)
+    asset = await db.scalar(query)
+    if asset is None:
+        raise HTTPException(status_code=404, detail=f"Unknown symbol: {symbol}")
+
+    raw = {key: value for key, value in request.query_params.items() if key not in INDICATOR_QUERY}
+    try:
+        params = parse_params(name, raw)
+        series = await get_indicator(db, asset.id, name, params, timeframe, start, end, limit, adjusted)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {"symbol": symbol, **series}
 
 @router.get("/add_to_watchlist/{asset_id}")
 async def add_to_watchlist(request: Request, asset_id: int, db: AsyncSession = Depends(get_db)):
@@ -108,6 +139,7 @@ async def add_to_watchlist(request: Request, asset_id: int, db: AsyncSession = D
     db.add(asset)
 
     await db.commit()
+    await notify_watchlist_changed()
 
     return RedirectResponse(url="/assets?filter=watchlist", status_code=303)
 
@@ -119,6 +151,7 @@ async def delete_from_watchlist(request: Request, asset_id: int, db: AsyncSessio
     await db.execute(query)
 
     await db.commit()
+    await notify_watchlist_changed()
 
     return RedirectResponse(url="/assets?filter=watchlist", status_code=303)
 
@@ -130,8 +163,27 @@ async def get_assets(request: Request, db: AsyncSession = Depends(get_db)):
     return RedirectResponse(url="/assets", status_code=303)
 
 @router.get("/populate_prices")
-async def get_prices(request: Request, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db)):
-    
-    background_tasks.add_task(populate_prices, db)
+async def get_prices(request: Request):
+
+    # The job and its batch rows are created here so the id is known up front;
+    # the batches themselves run as Celery tasks
+    job_id, total = await create_price_job(parse_timeframe(LOADER_TIMEFRAME))
+    dispatch(job_id, list(range(total)))
+
+    return RedirectResponse(url=f"/backfills/{job_id}", status_code=303)
+
+@router.get("/backfills/{job_id}")
+async def backfill_status(job_id: int, db: AsyncSession = Depends(get_db)):
+
+    progress = await job_progress(db, job_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Backfill job not found")
+
+    return progress
+
+@router.get("/backfills/{job_id}/resume")
+async def backfill_resume(job_id: int):
+
+    resume_backfill.delay(job_id)
 
-    return RedirectResponse(url="/assets", status_code=303)
\ No newline at end of file
+    return RedirectResponse(url=f"/backfills/{job_id}", status_code=303)
\ No newline at end of file
@@ -9,6 +9,7 @@ from db.database import *
 from sqlalchemy.future import select
 from sqlalchemy import delete
 from web.auth.auth import *
+from data.subscriptions import notify_watchlist_changed
 
 templates = Jinja2Templates(directory="/app/web/templates")
 router = APIRouter(
@@ -32,6 +33,7 @@ async def apply_strategy(
         # 2. Add the new object to the session and commit
         db.add(new_link)
         await db.commit() # This executes the INSERT operation
+        await notify_watchlist_changed()
 
         # 3. Redirect to the strategy detail page to show the added asset
         return RedirectResponse(url=f"/strategy/{strategy_id}", status_code=status.HTTP_303_SEE_OTHER)
@@ -67,6 +69,7 @@ async def delete_strategy(
 
         # 3. Commit the change
         await db.commit() 
+        await notify_watchlist_changed()
 
         # 4. Redirect to the strategy detail page to show the updated list
         return RedirectResponse(url=f"/strategy/{strategy_id}", status_code=status.HTTP_303_SEE_OTHER)